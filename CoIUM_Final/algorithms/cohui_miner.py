@@ -1,21 +1,219 @@
 """
 Thuật toán CoHUI-Miner (2020):
 - Dựa trên Prefix-Projection + Look-Ahead (LA) pruning
-- Mỗi prefix được mở rộng đệ quy theo lexicographic order
+- Mỗi prefix được mở rộng đệ quy theo thứ tự xử lý (TWU tăng dần)
+- Projected database là pseudo-projection: mỗi phần tử (tid, vị trí, utility
+  của prefix) trỏ vào database gốc đã sắp xếp lại item, không sao chép transaction
 """
 
+from collections import Counter
+import numpy as np
 from heuristics import twu_pruning
-from metrics import calculate_correlation, calculate_transaction_utility
-from data_utils import load_profits_from_file, generate_profits, save_profits_to_file
-from collections import defaultdict
-import itertools
+from metrics import CooccurrenceTable, calculate_kulc_pair, get_twu_table
+from search import TopKCollector
+from parallel import resolve_workers, run_prefix_tasks
+from data_utils import (load_profits_from_file, generate_profits, save_profits_to_file, CSRDataset,
+                        transaction_weights)
 
 
-def cohui_miner(dataset, minutil, mincor, maxlen=5, dataset_name="unknown"):
+def _current_minutil(cohuis, minutil_abs):
+    """Ngưỡng utility hiện tại (tăng dần trong chế độ top-k)"""
+    return cohuis.threshold if isinstance(cohuis, TopKCollector) else minutil_abs
+
+
+def _build_base_database(dataset, order, profits):
+    """
+    Database gốc dạng CSR: mỗi transaction chỉ giữ các item trong `order`
+    (item không qua TWU-pruning bị loại), sắp theo thứ tự xử lý, không trùng
+    lặp; utilities = profit x trọng số transaction. Transaction rỗng bị bỏ.
+    """
+    rank = {item: r for r, item in enumerate(order)}
+    weights = transaction_weights(dataset)
+    indptr, items, utilities = [0], [], []
+    for tid, trans in enumerate(dataset):
+        row = sorted(rank.keys() & set(trans), key=rank.__getitem__)
+        if not row:
+            continue
+        weight = weights[tid] if weights is not None else 1
+        items.extend(row)
+        utilities.extend(profits[item] * weight for item in row)
+        indptr.append(len(items))
+    utilities = np.asarray(utilities) if utilities else np.zeros(0, dtype=np.int64)
+    if utilities.dtype.kind not in 'iuf':
+        utilities = utilities.astype(np.float64)
+    return CSRDataset(np.asarray(indptr, dtype=np.int64), np.asarray(items, dtype=np.int64), utilities)
+
+
+class _ProjectionBase:
+    """
+    Truy cập nhanh database gốc khi đệ quy: memoryview (zero-copy, kể cả khi
+    database nằm trong shared memory) trên các mảng CSR.
+    """
+    __slots__ = ('csr', 'items', 'utilities', 'ends')
+
+    def __init__(self, csr):
+        self.csr = csr
+        self.items = memoryview(csr.indices)
+        self.utilities = memoryview(csr.utilities)
+        self.ends = memoryview(csr.indptr[1:])
+
+    def first_level(self, item):
+        """Pseudo-projection của prefix [item]: list (tid, vị trí của item, utility của item)"""
+        positions = np.flatnonzero(self.csr.indices == item)
+        tids = np.searchsorted(self.csr.indptr, positions, side='right') - 1
+        utilities = self.utilities
+        return [(tid, pos, utilities[pos]) for tid, pos in zip(tids.tolist(), positions.tolist())]
+
+
+def _new_pruning_stats():
+    """Số nút bị loại bởi từng cận (subtree utility, local utility, correlation)"""
+    return Counter(subtree_utility=0, local_utility=0, correlation=0)
+
+
+def _extension_correlations(item, candidates, correlations, supports, mincor, stats):
+    """
+    Các item được phép trong cây con của prefix + [item]: item z trong
+    candidates (đứng sau item) còn đạt mincor khi thêm item vào prefix.
+    Kulc là anti-monotone nên z đã không đạt thì không xuất hiện trong mọi
+    itemset của cây con. Trả về dict z -> min Kulc(x, z) với x thuộc prefix + [item].
+    """
+    allowed = {}
+    for z in candidates:
+        correlation = min(correlations[z], calculate_kulc_pair(item, z, supports))
+        if correlation >= mincor:
+            allowed[z] = correlation
+    stats['correlation'] += len(candidates) - len(allowed)
+    return allowed
+
+
+def _project(prefix, correlation, projected_db, allowed, base, context, cohuis, stats):
+    """
+    Đệ quy mở rộng theo prefix. projected_db: list (tid, vị trí item cuối của
+    prefix trong transaction, utility của prefix trong transaction); allowed:
+    dict item -> min Kulc với các item của prefix, gồm các item còn được phép
+    xuất hiện trong cây con của prefix.
+    Một lượt duyệt phần sau vị trí đó (từ cuối lên) sinh pseudo-projection
+    của mọi phần mở rộng z cùng hai cận trên (Look-Ahead):
+    - su(z) = Σ u(prefix) + u(z) + utility các item được phép đứng sau z:
+      cận của mọi itemset trong cây con prefix + [z] → cắt nút con
+    - lu(z) = Σ u(prefix) + utility mọi item được phép đứng sau prefix:
+      cận của mọi itemset mở rộng prefix có chứa z → loại z khỏi allowed của cây con
+    """
+    supports, minutil_abs, mincor, maxlen, rank = context
+    items, utilities, ends = base.items, base.utilities, base.ends
+    if len(prefix) + 1 >= maxlen:
+        _emit_leaves(prefix, correlation, projected_db, allowed, base, context, cohuis)
+        return
+
+    extensions = {}
+    subtree_utility = {}
+    local_utility = {}
+    for tid, pos, prefix_util in projected_db:
+        remaining = 0
+        present = []
+        for next_pos in range(ends[tid] - 1, pos, -1):
+            item = items[next_pos]
+            if item not in allowed:
+                continue
+            util = utilities[next_pos]
+            entry = (tid, next_pos, prefix_util + util)
+            if item in extensions:
+                extensions[item].append(entry)
+                subtree_utility[item] += prefix_util + util + remaining
+            else:
+                extensions[item] = [entry]
+                subtree_utility[item] = prefix_util + util + remaining
+            present.append(item)
+            remaining += util
+        for item in present:
+            local_utility[item] = local_utility.get(item, 0) + prefix_util + remaining
+
+    ordered = sorted(extensions, key=rank.__getitem__)
+    minutil_now = _current_minutil(cohuis, minutil_abs)
+    secondary = [item for item in ordered if local_utility[item] >= minutil_now]
+    stats['local_utility'] += len(ordered) - len(secondary)
+
+    for k, item in enumerate(secondary):
+        minutil_now = _current_minutil(cohuis, minutil_abs)
+        if subtree_utility[item] < minutil_now:
+            stats['subtree_utility'] += 1
+            continue
+
+        new_prefix = prefix + [item]
+        new_correlation = min(correlation, allowed[item])
+        new_projected = extensions[item]
+        utility = sum(entry[2] for entry in new_projected)
+        if utility >= minutil_now:
+            cohuis.append((new_prefix, utility, new_correlation))
+        if len(new_prefix) < maxlen and k + 1 < len(secondary):
+            new_allowed = _extension_correlations(item, secondary[k + 1:], allowed, supports, mincor, stats)
+            if new_allowed:
+                _project(new_prefix, new_correlation, new_projected, new_allowed, base, context, cohuis, stats)
+
+
+def _emit_leaves(prefix, correlation, projected_db, allowed, base, context, cohuis):
+    """
+    Các phần mở rộng của prefix đã ở độ dài maxlen: không đệ quy tiếp nên chỉ
+    cần utility chính xác của từng prefix + [z], không cần projection hay cận.
+    """
+    rank, minutil_abs = context[4], context[1]
+    items, utilities, ends = base.items, base.utilities, base.ends
+    totals = {}
+    for tid, pos, prefix_util in projected_db:
+        for next_pos in range(pos + 1, ends[tid]):
+            item = items[next_pos]
+            if item in allowed:
+                totals[item] = totals.get(item, 0) + prefix_util + utilities[next_pos]
+
+    for item in sorted(totals, key=rank.__getitem__):
+        utility = totals[item]
+        if utility >= _current_minutil(cohuis, minutil_abs):
+            cohuis.append((prefix + [item], utility, min(correlation, allowed[item])))
+
+
+def _mine_item(item, base, context, cohuis, stats):
+    """Khai thác toàn bộ cây con có prefix cấp 1 là item"""
+    supports, minutil_abs, mincor, maxlen, rank = context
+    projected_db = base.first_level(item)
+    utility = sum(entry[2] for entry in projected_db)
+    if utility >= _current_minutil(cohuis, minutil_abs):
+        cohuis.append(([item], utility, 1.0))
+    if maxlen > 1:
+        candidates = [z for z in rank if rank[z] > rank[item]]
+        allowed = _extension_correlations(item, candidates, dict.fromkeys(candidates, 1.0), supports, mincor,
+                                          stats)
+        if allowed:
+            _project([item], 1.0, projected_db, allowed, base, context, cohuis, stats)
+
+
+# Trạng thái của mỗi tiến trình worker (gửi một lần qua initializer)
+_worker_state = None
+
+
+def _init_worker(csr, context, top_k):
+    global _worker_state
+    _worker_state = (_ProjectionBase(csr), context, top_k)
+
+
+def _mine_item_task(item):
+    base, context, top_k = _worker_state
+    cohuis = TopKCollector(top_k, context[1]) if top_k is not None else []
+    stats = _new_pruning_stats()
+    _mine_item(item, base, context, cohuis, stats)
+    return (cohuis.results() if top_k is not None else cohuis), stats
+
+
+def cohui_miner(dataset, minutil, mincor, maxlen=5, dataset_name="unknown", top_k=None, workers=None,
+                stats=None):
     """
     Chuẩn thuật toán CoHUI-Miner (2020):
     - Dựa trên Prefix-Projection + Look-Ahead (LA) pruning
-    - Mỗi prefix được mở rộng đệ quy theo lexicographic order
+    - Mỗi prefix được mở rộng đệ quy theo thứ tự TWU tăng dần, chỉ với các
+      item đứng sau item cuối của prefix (mỗi itemset được duyệt đúng một lần)
+    - top_k: chỉ lấy k CoHUI có utility cao nhất (ngưỡng tự nâng dần)
+    - workers: số tiến trình khai thác song song các cây con prefix cấp 1
+    - stats: dict (tùy chọn) nhận số nút bị loại bởi từng cận sau khi chạy
+      (subtree_utility, local_utility, correlation)
     """
     if not dataset:
         return []
@@ -26,60 +224,44 @@ def cohui_miner(dataset, minutil, mincor, maxlen=5, dataset_name="unknown"):
         profits = generate_profits(items)
         save_profits_to_file(profits, dataset_name)
 
-    tu_values = [calculate_transaction_utility(t, profits) for t in dataset]
-    total_tu = sum(tu_values)
-    minutil_abs = minutil * total_tu
+    twu_table = get_twu_table(dataset, profits)
+    minutil_abs = minutil * twu_table.total_utility
 
     # Tính support cho correlation
-    supports = defaultdict(int)
-    for trans in dataset:
-        for k in range(1, min(len(trans) + 1, maxlen + 1)):
-            for comb in itertools.combinations(trans, k):
-                supports[frozenset(comb)] += 1
-
-    cohuis = []
-
-    def project(prefix, projected_db):
-        """Đệ quy mở rộng theo prefix"""
-        if len(prefix) >= maxlen:
-            return
-
-        # Tính utility hiện tại
-        prefix_util = sum(sum(profits[i] for i in t if i in prefix) for t in projected_db)
-        if prefix_util < minutil_abs:
-            return
-
-        # Tính correlation của prefix
-        if len(prefix) > 1:
-            corr = calculate_correlation(prefix, supports)
-            if corr < mincor:
-                return
-        else:
-            corr = 1.0
-
-        # Nếu đủ điều kiện → thêm vào CoHUIs
-        cohuis.append((prefix.copy(), prefix_util, corr))
-
-        # Mở rộng prefix
-        items_in_proj = sorted(set(i for t in projected_db for i in t if i not in prefix))
-        for item in items_in_proj:
-            new_prefix = prefix + [item]
-            new_projected = [t for t in projected_db if set(new_prefix).issubset(t)]
-            if not new_projected:
-                continue
+    supports = CooccurrenceTable.build(dataset)
 
-            # Look-Ahead pruning: nếu utility upper bound < minUtil thì bỏ
-            upper_bound = sum(calculate_transaction_utility(t, profits) for t in new_projected)
-            if upper_bound < minutil_abs:
-                continue
+    first_level = [item for item in items if twu_pruning(item, dataset, profits, minutil_abs, twu_table)]
+    first_level.sort(key=twu_table.get)
+    rank = {item: r for r, item in enumerate(first_level)}
+    context = (supports, minutil_abs, mincor, maxlen, rank)
+    csr = _build_base_database(dataset, first_level, profits)
 
-            project(new_prefix, new_projected)
-
-    # Bắt đầu với từng item đơn
-    for item in items:
-        if not twu_pruning(item, dataset, profits, minutil_abs):
-            continue
-        trans_proj = [t for t in dataset if item in t]
-        project([item], trans_proj)
+    workers = resolve_workers(workers)
+    if workers > 1 and len(first_level) > 1:
+        # Song song theo item cấp 1, cây con lớn (support x số item đứng sau) được giao trước.
+        # Database gốc được đặt một lần vào shared memory, worker attach theo tên (zero-copy)
+        weights = [supports.support(item) * (len(first_level) - r - 1) for r, item in enumerate(first_level)]
+        shared = csr.share()
+        try:
+            parts = run_prefix_tasks(_mine_item_task, first_level, weights, workers,
+                                     initializer=_init_worker, initargs=(shared, context, top_k))
+        finally:
+            shared.close()
+            shared.unlink()
+        cohuis = TopKCollector(top_k, minutil_abs) if top_k is not None else []
+        pruned = _new_pruning_stats()
+        for part, part_stats in parts:
+            for entry in part:
+                cohuis.append(entry)
+            pruned.update(part_stats)
+    else:
+        # Bắt đầu với từng item đơn
+        base = _ProjectionBase(csr)
+        cohuis = TopKCollector(top_k, minutil_abs) if top_k is not None else []
+        pruned = _new_pruning_stats()
+        for item in first_level:
+            _mine_item(item, base, context, cohuis, pruned)
 
-    return cohuis
\ No newline at end of file
+    if stats is not None:
+        stats.update(pruned)
+    return cohuis.results() if top_k is not None else cohuis
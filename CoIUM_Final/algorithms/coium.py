@@ -1,103 +1,265 @@
 import sys
-from structures import construct_utility_list, construct_utility_list_combined
-from heuristics import twu_pruning, correlation_pruning, utility_upper_bound_pruning
-from metrics import calculate_twu, calculate_correlation, defaultdict
-from data_utils import load_profits_from_file, generate_profits, save_profits_to_file
-import itertools
-
-def search_larger_itemsets_optimized(current_itemsets, dataset, profits, supports,
-                                     minutil_abs, mincor, maxlen, cohuis):
-    if not current_itemsets or len(current_itemsets[0][0]) >= maxlen:
-        return
-
-    next_level_itemsets = []
-    max_combinations = min(100, len(current_itemsets) * (len(current_itemsets) - 1) // 2)
-    combination_count = 0
-
-    for i in range(len(current_itemsets)):
-        for j in range(i + 1, len(current_itemsets)):
-            if combination_count >= max_combinations:
-                break
-            itemset_x, ul_x = current_itemsets[i]
-            itemset_y, ul_y = current_itemsets[j]
-            if len(itemset_x) == len(itemset_y) and itemset_x[:-1] == itemset_y[:-1]:
-                new_itemset = itemset_x + [itemset_y[-1]]
-                if len(new_itemset) > maxlen:
-                    continue
-                ul_combined = construct_utility_list_combined(ul_x, ul_y, dataset, profits)
-                if not ul_combined or not utility_upper_bound_pruning(ul_combined, minutil_abs):
-                    continue
-                actual_utility = ul_combined.get_total_utility()
-                if actual_utility >= minutil_abs:
-                    correlation = calculate_correlation(new_itemset, supports)
-                    if correlation >= mincor:
-                        cohuis.append((new_itemset, actual_utility, correlation))
-                        next_level_itemsets.append((new_itemset, ul_combined))
-                combination_count += 1
-        if combination_count >= max_combinations:
-            break
-
-    if next_level_itemsets:
-        search_larger_itemsets_optimized(next_level_itemsets, dataset, profits, supports,
-                                         minutil_abs, mincor, maxlen, cohuis)
-
-
-def coium(dataset, minutil, mincor, maxlen=5, dataset_name="unknown", profits=None):
+from structures import UtilityListBuilder, build_utility_lists
+from heuristics import twu_pruning
+from metrics import CooccurrenceTable, TWUTable, get_cooccurrence_table, get_twu_table
+from search import mine_equivalence_classes, mine_prefix_subtrees, topk_initial_threshold
+from data_utils import (WeightedDataset, iter_transaction_batches, transaction_weights, load_profits_from_file,
+                        generate_profits, save_profits_to_file)
+
+def coium(dataset, minutil, mincor, maxlen=5, dataset_name="unknown", profits=None, budget=None, top_k=None,
+          workers=None, target_items=None):
+    """
+    CoIUM: khai thác đầy đủ CoHUI bằng tìm kiếm depth-first theo lớp tương
+    đương prefix. budget (search.MiningBudget) giới hạn số join / thời gian;
+    sau khi chạy, budget.exhausted cho biết kết quả có bị cắt hay không.
+    top_k: chỉ lấy k CoHUI có utility cao nhất, ngưỡng utility tự nâng dần
+    trong lúc tìm kiếm (minutil khi đó là ngưỡng sàn, có thể đặt 0).
+    workers: số tiến trình khai thác song song các cây con prefix cấp 1
+    (None/1 = tuần tự, <= 0 = mọi CPU); kết quả không phụ thuộc workers.
+    target_items: chỉ khai thác các CoHUI chứa ít nhất một item trong
+    target_items (xem _coium_targeted); kết quả là đúng tập con tương ứng
+    của coium() không ràng buộc.
+    """
     if not dataset:
         return []
 
     items = sorted(set(i for trans in dataset for i in trans))
-    
-    # Sử dụng profits được truyền vào, nếu không có thì mới load từ file
+    profits = _resolve_profits(items, profits, dataset_name)
+    if target_items is not None:
+        return _coium_targeted(dataset, items, profits, target_items, minutil, mincor, maxlen, budget, top_k,
+                               workers)
+
+    twu_table = get_twu_table(dataset, profits, with_eucs=True)
+    supports = CooccurrenceTable.build(dataset)
+    candidate_items, minutil_abs = _select_candidates(items, twu_table, supports, minutil, profits, top_k)
+
+    utility_lists = build_utility_lists(candidate_items, dataset, profits)
+
+    return mine_equivalence_classes(candidate_items, utility_lists, supports, minutil_abs, mincor, maxlen,
+                                    twu_table, budget, top_k, workers)
+
+
+def _coium_targeted(dataset, items, profits, target_items, minutil, mincor, maxlen, budget, top_k, workers):
+    """
+    CoIUM ràng buộc "phải chứa ít nhất một target":
+    - Itemset chứa target t chỉ xuất hiện trong tidset của t, nên TWU, EUCS và
+      Utility-List chỉ cần xây trên các transaction chứa target (utility vẫn
+      chính xác, TWU/EUCS cục bộ là cận chặt hơn)
+    - Ngưỡng minutil x tổng utility và support cho Kulc vẫn tính trên toàn
+      dataset (dùng bảng đã cache theo dataset nếu có)
+    - Target được xếp đầu thứ tự xử lý và chỉ target làm prefix cấp 1: item
+      đầu tiên của mọi itemset chứa target là một target, nên mỗi itemset cần
+      tìm nằm đúng trong một cây con được duyệt
+    """
+    item_set = set(items)
+    targets = set(item for item in target_items if item in item_set)
+    if not targets:
+        return []
+
+    weights = transaction_weights(dataset)
+    tids = [tid for tid, trans in enumerate(dataset) if not targets.isdisjoint(trans)]
+    neighborhood = [dataset[tid] for tid in tids]
+    if weights is not None:
+        neighborhood = WeightedDataset(neighborhood, [weights[tid] for tid in tids])
+
+    total_utility = get_twu_table(dataset, profits).total_utility
+    supports = get_cooccurrence_table(dataset)
+    local_table = TWUTable.build(neighborhood, profits, with_eucs=True)
+    local_items = sorted(set(i for trans in neighborhood for i in trans))
+
+    minutil_abs = minutil * total_utility
+    if top_k is not None:
+        # Chỉ item đơn là target mới là kết quả hợp lệ để nâng ngưỡng ban đầu
+        minutil_abs = max(minutil_abs, topk_initial_threshold(
+            [profits[item] * supports.support(item) for item in sorted(targets)], top_k))
+
+    candidate_items = [item for item in local_items if twu_pruning(item, None, profits, minutil_abs, local_table)]
+    candidate_items.sort(key=lambda item: (item not in targets, -local_table.get(item)))
+    n_targets = sum(1 for item in candidate_items if item in targets)
+    if n_targets == 0:
+        return []
+
+    utility_lists = build_utility_lists(candidate_items, neighborhood, profits)
+    return mine_equivalence_classes(candidate_items, utility_lists, supports, minutil_abs, mincor, maxlen,
+                                    local_table, budget, top_k, workers, n_first_level=n_targets)
+
+
+def coium_stream(file_path, minutil, mincor, maxlen=5, dataset_name="unknown", profits=None, budget=None,
+                 top_k=None, workers=None, batch_size=10000):
+    """
+    CoIUM trên file dataset đọc theo từng lô batch_size transaction
+    (data_utils.iter_transaction_batches) thay vì nạp toàn bộ vào RAM.
+    File được duyệt 3 lượt: support/co-occurrence, TWU + EUCS, rồi Utility-List
+    của các item ứng viên; bộ nhớ đỉnh chỉ phụ thuộc kích thước lô và các cấu
+    trúc cuối cùng. Kết quả giống hệt coium(load_dataset(file_path), ...).
+    """
+    supports = CooccurrenceTable.build_from_batches(iter_transaction_batches(file_path, batch_size))
+    if supports.n_transactions == 0:
+        return []
+
+    items = sorted(supports.item_supports)
+    profits = _resolve_profits(items, profits, dataset_name)
+
+    twu_table = TWUTable.build_from_batches(iter_transaction_batches(file_path, batch_size), profits,
+                                            with_eucs=True)
+    candidate_items, minutil_abs = _select_candidates(items, twu_table, supports, minutil, profits, top_k)
+
+    builder = UtilityListBuilder(candidate_items, profits)
+    for batch in iter_transaction_batches(file_path, batch_size):
+        builder.add_transactions(batch)
+    utility_lists = builder.build()
+
+    return mine_equivalence_classes(candidate_items, utility_lists, supports, minutil_abs, mincor, maxlen,
+                                    twu_table, budget, top_k, workers)
+
+
+class IncrementalCoIUM:
+    """
+    CoIUM tăng dần cho dataset được thêm transaction (vd. đơn hàng mới) và
+    loại transaction cũ nhất (evict, vd. cửa sổ thời gian trượt).
+    Giữ TWU + EUCS, support item/cặp và Utility-List giữa các lần khai thác;
+    add_transactions()/evict() chỉ áp dụng phần thay đổi, mine() chỉ tìm lại
+    cây con của các item cấp 1 "bẩn": item xuất hiện trong transaction được
+    thêm/loại hoặc từng đi cùng một item như vậy. Cây con sạch không chứa item
+    nào có utility/support thay đổi, nên khi ngưỡng minutil x tổng utility
+    không giảm, kết quả cũ chỉ cần lọc lại theo ngưỡng mới; ngưỡng giảm (sau
+    evict) thì mọi cây con được tìm lại.
+    Tập kết quả giống hệt coium() trên toàn bộ dataset; thứ tự xử lý được cố
+    định từ lần thêm đầu tiên (TWU giảm dần, item mới xếp cuối) nên thứ tự
+    các itemset trong list có thể khác.
+    """
+
+    def __init__(self, minutil, mincor, maxlen=5, dataset_name="unknown", profits=None, workers=None):
+        self.minutil = minutil
+        self.mincor = mincor
+        self.maxlen = maxlen
+        self.dataset_name = dataset_name
+        self.profits = profits
+        self.workers = workers
+        self.twu_table = TWUTable(with_eucs=True, keep_transaction_utilities=False)
+        self.supports = CooccurrenceTable()
+        self.builder = None
+        self._neighbors = {}
+        self._subtrees = {}
+        self._dirty = set()
+        self._first_tid = 0
+        self._minutil_abs = None
+
+    @property
+    def n_transactions(self):
+        return self.supports.n_transactions
+
+    def add_transactions(self, transactions):
+        """Áp dụng các transaction mới (list of lists hoặc WeightedDataset) vào các bảng và Utility-List"""
+        if not isinstance(transactions, list):
+            transactions = list(transactions)
+        weights = transaction_weights(transactions)
+        touched = set(i for trans in transactions for i in trans)
+        if not touched:
+            return
+        unseen = sorted(touched - self.supports.item_supports.keys())
+        if self.profits is None:
+            self.profits = _resolve_profits(unseen, None, self.dataset_name)
+        else:
+            _resolve_profits(unseen, self.profits, self.dataset_name)
+
+        self.twu_table.update(transactions, self.profits, weights)
+        self.supports.update(transactions, weights)
+        if self.builder is None:
+            self.builder = UtilityListBuilder(sorted(unseen, key=self.twu_table.get, reverse=True), self.profits)
+        else:
+            self.builder.add_items(unseen)
+        self.builder.add_transactions(transactions, weights)
+
+        for trans in transactions:
+            unique_items = set(trans)
+            for item in unique_items:
+                self._neighbors.setdefault(item, set()).update(unique_items)
+        for item in touched:
+            self._dirty.update(self._neighbors[item])
+
+    def evict(self, transactions):
+        """
+        Loại các transaction cũ nhất: transactions phải đúng là các transaction
+        được thêm sớm nhất còn lại, theo thứ tự thêm (list hoặc WeightedDataset
+        cùng trọng số như lúc thêm). TWU/EUCS và support được trừ đi, Utility-List
+        bỏ phần tử của các tid đó; không cấu trúc nào phải xây lại.
+        """
+        if not isinstance(transactions, list):
+            transactions = list(transactions)
+        if not transactions or self.builder is None:
+            return
+        weights = transaction_weights(transactions)
+        negated = [-w for w in weights] if weights is not None else [-1] * len(transactions)
+        self.twu_table.update(transactions, self.profits, negated)
+        self.supports.update(transactions, negated)
+        self._first_tid += len(transactions)
+        self.builder.drop_before(self._first_tid)
+
+        touched = set(i for trans in transactions for i in trans)
+        for item in touched:
+            self._dirty.update(self._neighbors[item])
+            if not self.builder.item_count(item):
+                # Item không còn trong dataset: bỏ sai số làm tròn khi trừ trọng số thực
+                self.twu_table.twu[item] = 0
+                self.supports.item_supports[item] = 0
+
+    def mine(self):
+        """Khai thác lại, chỉ tìm kiếm cây con của các item bẩn; trả về list (itemset, utility, correlation)"""
+        if self.builder is None:
+            return []
+        minutil_abs = self.minutil * self.twu_table.total_utility
+        candidate_items = [item for item in self.builder.items
+                           if self.twu_table.get(item) >= minutil_abs and self.supports.support(item) > 0]
+        if self._minutil_abs is not None and minutil_abs < self._minutil_abs:
+            research = candidate_items
+        else:
+            research = [item for item in candidate_items if item in self._dirty or item not in self._subtrees]
+
+        subtrees = {}
+        for item in candidate_items:
+            if item not in research:
+                subtrees[item] = [entry for entry in self._subtrees[item] if entry[1] >= minutil_abs]
+        if research:
+            utility_lists = self.builder.build(candidate_items, copy=True)
+            subtrees.update(mine_prefix_subtrees(candidate_items, utility_lists, research, self.supports,
+                                                 minutil_abs, self.mincor, self.maxlen, self.twu_table,
+                                                 self.workers))
+        self._subtrees = subtrees
+        self._dirty.clear()
+        self._minutil_abs = minutil_abs
+        return [entry for item in candidate_items for entry in subtrees[item]]
+
+    def update(self, transactions):
+        """add_transactions() rồi mine()"""
+        self.add_transactions(transactions)
+        return self.mine()
+
+
+def _resolve_profits(items, profits, dataset_name):
+    """Dùng profits truyền vào, nếu không có thì load từ file / sinh mới; item thiếu profit nhận giá trị 1"""
     if profits is None:
         profits = load_profits_from_file(dataset_name)
         if profits is None:
             profits = generate_profits(items)
             save_profits_to_file(profits, dataset_name)
-    
+
     # Đảm bảo tất cả items đều có profit
     for item in items:
         if item not in profits:
             print(f"Warning: Item {item} không có profit, sử dụng giá trị mặc định", file=sys.stderr)
             profits[item] = 1  # Default profit
+    return profits
+
+
+def _select_candidates(items, twu_table, supports, minutil, profits, top_k):
+    """Tính minutil tuyệt đối và các item ứng viên qua TWU-pruning, sắp theo TWU giảm dần"""
+    minutil_abs = minutil * twu_table.total_utility
+    if top_k is not None:
+        # Nâng ngưỡng ngay từ đầu bằng utility của item đơn để TWU-pruning mạnh hơn
+        minutil_abs = max(minutil_abs, topk_initial_threshold(
+            [profits[item] * supports.support(item) for item in items], top_k))
 
-    tu_values = [sum(profits.get(i, 0) for i in trans) for trans in dataset]
-    total_tu = sum(tu_values)
-    minutil_abs = minutil * total_tu
-
-    candidate_items = [item for item in items if twu_pruning(item, dataset, profits, minutil_abs)]
-    candidate_items.sort(key=lambda x: calculate_twu(x, dataset, profits), reverse=True)
-
-    utility_lists = {item: construct_utility_list(item, dataset, profits) for item in candidate_items}
-
-    supports = defaultdict(int)
-    for trans in dataset:
-        for k in range(1, min(len(trans) + 1, maxlen + 1)):
-            for comb in itertools.combinations(trans, k):
-                supports[frozenset(comb)] += 1
-
-    valid_pairs = []
-    for i in range(len(candidate_items)):
-        for j in range(i + 1, len(candidate_items)):
-            a, b = candidate_items[i], candidate_items[j]
-            if correlation_pruning([a, b], supports, mincor):
-                ul_combined = construct_utility_list_combined(utility_lists[a], utility_lists[b], dataset, profits)
-                if ul_combined and utility_upper_bound_pruning(ul_combined, minutil_abs):
-                    valid_pairs.append(([a, b], ul_combined))
-
-    cohuis = []
-    for item in candidate_items:
-        ul = utility_lists[item]
-        if ul.get_total_utility() >= minutil_abs:
-            cohuis.append(([item], ul.get_total_utility(), 1.0))
-
-    for itemset, ul in valid_pairs:
-        if ul.get_total_utility() >= minutil_abs:
-            correlation = calculate_correlation(itemset, supports)
-            if correlation >= mincor:
-                cohuis.append((itemset, ul.get_total_utility(), correlation))
-
-    search_larger_itemsets_optimized(valid_pairs, dataset, profits, supports,
-                                     minutil_abs, mincor, maxlen, cohuis)
-
-    return cohuis
\ No newline at end of file
+    candidate_items = [item for item in items if twu_pruning(item, None, profits, minutil_abs, twu_table)]
+    candidate_items.sort(key=twu_table.get, reverse=True)
+    return candidate_items, minutil_abs
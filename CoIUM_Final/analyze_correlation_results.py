@@ -1,31 +1,34 @@
 """
 PHÂN TÍCH KẾT QUẢ CORRELATION ĐỂ TẠO BẢNG GỢI Ý SẢN PHẨM
 Đồ án tốt nghiệp - Fashion Store
+
+Hai engine cho cùng một kết quả (kể cả thứ tự khi bằng lift):
+- sparse: ma trận transaction x item thưa (scipy.sparse), co-occurrence là
+  tích X^T X, lift tính theo vector trên các phần tử khác 0, top-k mọi dòng
+  bằng một lần lexsort; mặc định (scipy có trong requirements.txt)
+- python: bảng dict-of-dicts duyệt từng cặp item trong transaction; engine
+  "auto" dùng khi không import được scipy (kèm cảnh báo)
 """
 
 import json
+import sys
 from collections import defaultdict
+import numpy as np
 
-def analyze_correlations():
-    """Phân tích dữ liệu để tìm các sản phẩm tương quan"""
-    
-    print("\n" + "="*80)
-    print("PHAN TICH CAC SAN PHAM TUONG QUAN")
-    print("="*80 + "\n")
-    
-    # Load transactions
-    print("Dang load du lieu transactions...")
-    transactions = []
-    with open("datasets/fashion_store.dat", 'r', encoding='utf-8') as f:
-        for line in f:
-            items = [int(x) for x in line.strip().split() if x.isdigit()]
-            if items:
-                transactions.append(items)
-    
-    print(f"Da load {len(transactions)} transactions\n")
-    
-    # Tính toán co-occurrence matrix
-    print("Dang tinh toan co-occurrence matrix...")
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+# Số sản phẩm tương quan giữ lại cho mỗi sản phẩm trong file JSON
+TOP_RECOMMENDATIONS = 10
+
+
+def _correlations_python(transactions, top_k):
+    """
+    Engine gốc: trả về (item_count, correlations), item_count theo thứ tự
+    xuất hiện đầu tiên, correlations[item] là top_k sản phẩm giảm dần theo lift.
+    """
     co_occurrence = defaultdict(lambda: defaultdict(int))
     item_count = defaultdict(int)
     
@@ -41,10 +44,6 @@ def analyze_correlations():
                 co_occurrence[item1][item2] += 1
                 co_occurrence[item2][item1] += 1
     
-    print(f"Da phan tich {len(item_count)} san pham unique\n")
-    
-    # Tính correlation score cho mỗi cặp
-    print("Dang tinh correlation scores...")
     correlations = {}
     
     for item1 in co_occurrence:
@@ -68,7 +67,190 @@ def analyze_correlations():
         
         # Sort theo lift giảm dần
         correlations[item1].sort(key=lambda x: x['lift'], reverse=True)
+        del correlations[item1][top_k:]
+    
+    return item_count, correlations
+
+
+# Số cặp vị trí tối đa sinh ra trong một lượt khi tìm lần đầu cùng xuất hiện
+PAIR_CHUNK_SIZE = 1 << 22
+
+
+def _first_pair_keys(rows, cols, positions, a, b):
+    """
+    Thứ tự engine python thêm cặp (a[k], b[k]) vào co_occurrence: lần đầu hai
+    item cùng xuất hiện, theo (transaction, vị trí nhỏ, vị trí lớn) với vị trí
+    là lần xuất hiện đầu tiên của mỗi item trong transaction đó (cặp (a, a):
+    hai lần xuất hiện đầu tiên). Trả về mảng (3, len(a)); chỉ dùng để xếp các
+    sản phẩm bằng lift. Cặp khác nhau được tìm bằng cách sinh các cặp vị trí
+    theo từng khối transaction (đúng thứ tự duyệt của engine python) và dừng
+    khi đã gặp đủ mọi cặp cần tìm.
+    """
+    n_items = int(cols.max()) + 1
+    keys = np.zeros((3, len(a)), dtype=np.int64)
+
+    # Mỗi (transaction, item): vị trí đầu tiên và thứ hai (-1 nếu không lặp)
+    order = np.lexsort((positions, cols, rows))
+    rows, cols, positions = rows[order], cols[order], positions[order]
+    first = np.ones(len(cols), dtype=bool)
+    first[1:] = (cols[1:] != cols[:-1]) | (rows[1:] != rows[:-1])
+    second = np.full(len(cols), -1, dtype=np.int64)
+    repeated = np.flatnonzero(~first)
+    repeated = repeated[first[repeated - 1]]
+    second[repeated - 1] = positions[repeated]
+    rows, cols, positions, second = rows[first], cols[first], positions[first], second[first]
+
+    diagonal = a == b
+    if diagonal.any():
+        # Transaction đầu tiên item lặp lại
+        repeats = np.flatnonzero(second >= 0)
+        items, index = np.unique(cols[repeats], return_index=True)
+        k = repeats[index][np.searchsorted(items, a[diagonal])]
+        keys[:, diagonal] = rows[k], positions[k], second[k]
+
+    off = np.flatnonzero(~diagonal)
+    if not len(off):
+        return keys
+    # Sắp theo vị trí trong transaction: cặp (i, j), i < j sinh ra theo đúng thứ tự (vị trí i, vị trí j)
+    order = np.lexsort((positions, rows))
+    rows, cols, positions = rows[order], cols[order], positions[order]
+    wanted = np.minimum(a[off], b[off]) * n_items + np.maximum(a[off], b[off])
+    pending = np.unique(wanted)
+    found_codes, found_keys = [], []
+
+    ends = np.searchsorted(rows, rows, side='right')
+    later = ends - np.arange(len(rows)) - 1
+    cumulative = np.cumsum(later)
+    start = 0
+    while start < len(rows) and len(pending):
+        # Khối entry [start, stop) sinh khoảng PAIR_CHUNK_SIZE cặp (ít nhất một entry)
+        stop = int(np.searchsorted(cumulative, cumulative[start] - later[start] + PAIR_CHUNK_SIZE, side='right'))
+        stop = max(stop, start + 1)
+        counts = later[start:stop]
+        left = np.repeat(np.arange(start, stop), counts)
+        right = left + 1 + np.arange(len(left)) - np.repeat(np.cumsum(counts) - counts, counts)
+        codes = np.minimum(cols[left], cols[right]) * n_items + np.maximum(cols[left], cols[right])
+        hit = np.flatnonzero(np.isin(codes, pending))
+        codes, index = np.unique(codes[hit], return_index=True)
+        k = hit[index]
+        found_codes.append(codes)
+        found_keys.append(np.vstack((rows[left[k]], positions[left[k]], positions[right[k]])))
+        pending = np.setdiff1d(pending, codes, assume_unique=True)
+        start = stop
+
+    found_codes = np.concatenate(found_codes)
+    found_keys = np.hstack(found_keys)
+    order = np.argsort(found_codes)
+    keys[:, off] = found_keys[:, order[np.searchsorted(found_codes, wanted, sorter=order)]]
+    return keys
+
+
+def _correlations_sparse(transactions, top_k):
+    """Engine ma trận thưa, cùng kết quả (và thứ tự) với _correlations_python"""
+    n_transactions = len(transactions)
+    lengths = np.fromiter((len(trans) for trans in transactions), dtype=np.int64, count=n_transactions)
+    flat = np.fromiter((item for trans in transactions for item in trans), dtype=np.int64, count=int(lengths.sum()))
+    items, cols = np.unique(flat, return_inverse=True)
+    rows = np.repeat(np.arange(n_transactions), lengths)
+    positions = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # X[t, i] = số lần item i xuất hiện trong transaction t
+    X = sparse.csr_matrix((np.ones(len(flat), dtype=np.int64), (rows, cols)), shape=(n_transactions, len(items)))
+    counts = np.asarray(X.sum(axis=0)).ravel()
+    # Đường chéo X^T X là Σ x², engine python đếm x(x - 1) cho các cặp vị trí cùng item
+    C = (X.T @ X).tocsr()
+    C.setdiag(C.diagonal() - counts)
+    C.eliminate_zeros()
+    C.sort_indices()
+
+    # Lift = P(A,B) / (P(A) * P(B)), cùng thứ tự phép tính với engine python
+    co_rows = np.repeat(np.arange(len(items)), np.diff(C.indptr))
+    lift = (C.data / n_transactions) / ((counts[co_rows] / n_transactions) * (counts[C.indices] / n_transactions))
+
+    # Thứ tự item: lần đầu xuất hiện (item_count) / lần đầu nằm trong một cặp (co_occurrence)
+    _, first_seen = np.unique(cols, return_index=True)
+    count_order = np.argsort(first_seen, kind='stable')
+    in_pairs = lengths[rows] >= 2
+    _, first_paired = np.unique(cols[in_pairs], return_index=True)
+    paired_items = np.unique(cols[in_pairs])
+    pair_order = paired_items[np.argsort(first_paired, kind='stable')]
+    item_count = {int(items[i]): int(counts[i]) for i in count_order.tolist()}
+
+    # Top-k mỗi dòng: sắp các phần tử theo (dòng, lift giảm dần); chỉ những nhóm bằng
+    # lift chạm tới top-k mới cần thứ tự cặp được thêm vào bảng như engine python (sort ổn định)
+    if not C.nnz:
+        return item_count, {}
+    order = np.lexsort((-lift, co_rows))
+    sorted_rows, sorted_lift = co_rows[order], lift[order]
+    rank = np.arange(len(order)) - C.indptr[sorted_rows]
+    same = (sorted_rows[1:] == sorted_rows[:-1]) & (sorted_lift[1:] == sorted_lift[:-1])
+    group = np.concatenate(([0], np.cumsum(~same)))
+    group_start_rank = rank[np.concatenate(([0], np.flatnonzero(~same) + 1))][group]
+    tied = np.zeros(len(order), dtype=bool)
+    tied[1:] |= same
+    tied[:-1] |= same
+    tied &= group_start_rank < top_k
+
+    tie_keys = np.zeros((3, len(order)), dtype=np.int64)
+    if tied.any():
+        tie_keys[:, tied] = _first_pair_keys(rows, cols, positions, sorted_rows[tied], C.indices[order[tied]])
+    order = order[np.lexsort((tie_keys[2], tie_keys[1], tie_keys[0], -sorted_lift, sorted_rows))]
+
+    neighbors = items[C.indices[order]].tolist()
+    co_counts = C.data[order].tolist()
+    lifts = lift[order].tolist()
+    correlations = {}
+    for a in pair_order.tolist():
+        start = C.indptr[a]
+        end = min(C.indptr[a + 1], start + top_k)
+        correlations[int(items[a])] = [
+            {
+                'item': neighbors[k],
+                'co_occurrence': co_counts[k],
+                'lift': lifts[k],
+                'support': co_counts[k] / n_transactions * 100
+            }
+            for k in range(start, end)
+        ]
+
+    return item_count, correlations
+
+
+def analyze_correlations(dataset_path="datasets/fashion_store.dat", output_file="correlation_recommendations.json",
+                         engine="auto"):
+    """
+    Phân tích dữ liệu để tìm các sản phẩm tương quan.
+    engine: "sparse", "python" hoặc "auto" (sparse nếu có scipy)
+    """
+    if engine == "auto":
+        engine = "sparse" if sparse is not None else "python"
+        if sparse is None:
+            print("Warning: không có scipy, dùng engine python (chậm hơn); cài đặt: pip install scipy",
+                  file=sys.stderr)
+    if engine == "sparse" and sparse is None:
+        raise ImportError("Engine sparse cần scipy (pip install scipy)")
+    
+    print("\n" + "="*80)
+    print("PHAN TICH CAC SAN PHAM TUONG QUAN")
+    print("="*80 + "\n")
+    
+    # Load transactions
+    print("Dang load du lieu transactions...")
+    transactions = []
+    with open(dataset_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            items = [int(x) for x in line.strip().split() if x.isdigit()]
+            if items:
+                transactions.append(items)
+    
+    print(f"Da load {len(transactions)} transactions\n")
+    
+    # Tính co-occurrence và correlation score (Lift) cho mỗi cặp
+    print(f"Dang tinh co-occurrence va correlation scores (engine {engine})...")
+    compute = _correlations_sparse if engine == "sparse" else _correlations_python
+    item_count, correlations = compute(transactions, TOP_RECOMMENDATIONS)
     
+    print(f"Da phan tich {len(item_count)} san pham unique")
     print("Hoan thanh!\n")
     
     # Hiển thị top correlations cho một số sản phẩm phổ biến
@@ -84,7 +266,7 @@ def analyze_correlations():
         print(f"{'Rank':<6} {'Item':<8} {'Co-occur':<12} {'Lift':<10} {'Support %':<12}")
         print("-" * 60)
         
-        top_corr = correlations[item_id][:5]
+        top_corr = correlations.get(item_id, [])[:5]
         for rank, corr in enumerate(top_corr, 1):
             print(f"{rank:<6} #{corr['item']:<7} {corr['co_occurrence']:<12} "
                   f"{corr['lift']:<10.3f} {corr['support']:<12.2f}")
@@ -98,11 +280,10 @@ def analyze_correlations():
     recommendation_map = {}
     for item_id in correlations:
         # Lấy top 10 sản phẩm tương quan nhất
-        top_10 = [c['item'] for c in correlations[item_id][:10]]
+        top_10 = [c['item'] for c in correlations[item_id][:TOP_RECOMMENDATIONS]]
         recommendation_map[str(item_id)] = top_10
     
     # Lưu vào file
-    output_file = "correlation_recommendations.json"
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(recommendation_map, f, indent=2, ensure_ascii=False)
     
@@ -0,0 +1,311 @@
+"""
+Benchmark lặp lại được cho ba thuật toán (CoIUM, CoUPM, CoHUI-Miner) trên datasets/:
+- Mỗi (dataset, thuật toán) chạy trong một tiến trình con riêng (spawn) nên
+  bộ nhớ đỉnh (ru_maxrss) và cache bảng TWU không lẫn giữa các lần đo
+- warmup lần chạy bỏ qua, rồi repeat lần chạy đo thời gian (perf_counter);
+  thêm một lần chạy dưới tracemalloc để lấy bộ nhớ Python cấp phát lúc đỉnh
+- Kết quả ghi ra JSON; so với một baseline đã lưu (--baseline) để báo hồi quy
+  thời gian / bộ nhớ / số pattern, thoát với mã 1 nếu có hồi quy
+
+Ví dụ (chạy trong thư mục CoIUM_Final):
+    python benchmark.py --datasets chess fashion_store --save-baseline baseline.json
+    python benchmark.py --datasets chess fashion_store --baseline baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+from data_utils import load_dataset, generate_profits
+from evaluation import peak_rss_mb
+
+BENCHMARK_VERSION = 1
+DATASET_DIR = "datasets"
+DATASET_EXTENSIONS = (".dat", ".csv")
+# Thư mục làm việc của tiến trình đo (trong cache/, không commit): chứa profits/ mà các thuật toán đọc
+WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "benchmark")
+# Seed sinh profits cho dataset chưa có file trong profits/
+PROFIT_SEED = 0
+
+ALGORITHMS = {
+    "CoIUM": ("algorithms.coium", "coium"),
+    "CoUPM": ("algorithms.coup_miner", "coup_miner"),
+    "CoHUI-Miner": ("algorithms.cohui_miner", "cohui_miner"),
+}
+
+# Ngưỡng hồi quy mặc định: chậm hơn 10% / tốn bộ nhớ hơn 10% so với baseline
+TIME_THRESHOLD = 0.10
+MEMORY_THRESHOLD = 0.10
+# Bỏ qua chênh lệch tuyệt đối nhỏ hơn mức này (nhiễu đo của các case chạy rất nhanh)
+MIN_TIME_DELTA = 0.05
+MIN_MEMORY_DELTA = 1.0
+
+
+def available_datasets(directory=DATASET_DIR):
+    """Tên (không đuôi) -> đường dẫn của các file dataset trong directory"""
+    datasets = {}
+    for file_name in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(file_name)
+        if ext in DATASET_EXTENSIONS:
+            datasets[name] = os.path.join(directory, file_name)
+    return datasets
+
+
+def _load_case_data(path, max_transactions):
+    data = load_dataset(path)
+    if max_transactions is not None:
+        data = data[:max_transactions]
+    return data
+
+
+def prepare_profits(name, path, work_dir=WORK_DIR):
+    """
+    Đặt profits của dataset vào work_dir/profits (các thuật toán đọc
+    profits/<name>_profits.txt theo thư mục hiện tại): bản sao file trong
+    profits/ nếu có, nếu không thì sinh với seed cố định. Mọi lần chạy (và
+    mọi thuật toán) dùng cùng profits mà không ghi file mới vào profits/.
+    Trả về nguồn profits ("file" hoặc "seed:<PROFIT_SEED>").
+    """
+    target = os.path.join(work_dir, "profits", f"{name}_profits.txt")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    source = os.path.join("profits", f"{name}_profits.txt")
+    if os.path.exists(source):
+        shutil.copyfile(source, target)
+        return "file"
+
+    items = sorted(set(i for trans in load_dataset(path) for i in trans))
+    np.random.seed(PROFIT_SEED)
+    profits = generate_profits(items)
+    with open(target, "w", encoding="utf-8") as f:
+        for item, p in sorted(profits.items()):
+            f.write(f"{item} {p}\n")
+    return f"seed:{PROFIT_SEED}"
+
+
+def _summary(times):
+    return {
+        "times": [round(t, 6) for t in times],
+        "min": round(min(times), 6),
+        "median": round(statistics.median(times), 6),
+        "mean": round(statistics.mean(times), 6),
+        "stdev": round(statistics.stdev(times), 6) if len(times) > 1 else 0.0,
+    }
+
+
+def _run_case(case, conn):
+    """Thân tiến trình con: đo một (dataset, thuật toán), gửi kết quả qua conn"""
+    try:
+        os.chdir(case["work_dir"])
+        import importlib
+        from metrics import clear_table_caches
+        module_name, func_name = ALGORITHMS[case["algorithm"]]
+        algo = getattr(importlib.import_module(module_name), func_name)
+        data = _load_case_data(case["path"], case["max_transactions"])
+        args = (data, case["minutil"], case["mincor"], case["maxlen"], case["dataset"])
+
+        # Log của thuật toán (stdout) không lẫn vào bảng kết quả
+        sys.stdout = open(os.devnull, 'w')
+        rss_before = peak_rss_mb()
+        for _ in range(case["warmup"]):
+            clear_table_caches()
+            algo(*args)
+
+        times = []
+        cohuis = []
+        for _ in range(case["repeat"]):
+            clear_table_caches()
+            start = time.perf_counter()
+            cohuis = algo(*args)
+            times.append(time.perf_counter() - start)
+        peak_rss = peak_rss_mb()
+
+        clear_table_caches()
+        tracemalloc.start()
+        algo(*args)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = _summary(times)
+        result.update({
+            "n_transactions": len(data),
+            "patterns": len(cohuis),
+            "peak_traced_mb": round(peak_traced / 1024 / 1024, 3),
+            "peak_rss_mb": round(peak_rss, 3) if peak_rss is not None else None,
+            "rss_before_mb": round(rss_before, 3) if rss_before is not None else None,
+        })
+        conn.send(result)
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_case(case, timeout=None):
+    """Chạy _run_case trong tiến trình con mới, trả về dict kết quả"""
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_case, args=(case, child_conn))
+    process.start()
+    child_conn.close()
+    result = None
+    timed_out = not parent_conn.poll(timeout)
+    if not timed_out:
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            pass
+    if process.is_alive():
+        process.terminate()
+    process.join()
+    if result is None:
+        result = {"error": f"quá thời gian {timeout}s" if timed_out
+                  else f"tiến trình con thoát với mã {process.exitcode}"}
+    return result
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def case_key(result):
+    return (result["dataset"], result["algorithm"], result["minutil"], result["mincor"], result["maxlen"],
+            result.get("n_transactions"))
+
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD,
+            min_time_delta=MIN_TIME_DELTA, min_memory_delta=MIN_MEMORY_DELTA):
+    """
+    So results với baseline["results"] theo case_key. Trả về list dict
+    (case, metric, baseline, current, change, regression) cho các case có ở cả hai.
+    Thời gian so theo median, bộ nhớ theo peak_traced_mb; số pattern phải khớp tuyệt đối.
+    """
+    previous = {case_key(r): r for r in baseline.get("results", []) if "error" not in r}
+    rows = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None or "error" in result:
+            continue
+        case = f"{result['dataset']}/{result['algorithm']}"
+        for metric, threshold, min_delta in (("median", time_threshold, min_time_delta),
+                                             ("peak_traced_mb", memory_threshold, min_memory_delta)):
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            rows.append({"case": case, "metric": metric, "baseline": before, "current": after,
+                         "change": round(change, 4),
+                         "regression": change > threshold and after - before > min_delta})
+        rows.append({"case": case, "metric": "patterns", "baseline": old["patterns"],
+                     "current": result["patterns"], "change": None,
+                     "regression": old["patterns"] != result["patterns"]})
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'Case':<28} {'Metric':<15} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+    for row in rows:
+        change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else ""
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['case']:<28} {row['metric']:<15} {row['baseline']:>12} {row['current']:>12} "
+              f"{change:>9}{flag}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CoIUM / CoUPM / CoHUI-Miner trên datasets/")
+    parser.add_argument("--datasets", nargs="+", help="tên dataset trong datasets/ (mặc định: tất cả)")
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), default=list(ALGORITHMS))
+    parser.add_argument("--minutil", type=float, default=0.01)
+    parser.add_argument("--mincor", type=float, default=0.3)
+    parser.add_argument("--maxlen", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-transactions", type=int, help="chỉ dùng N transaction đầu của mỗi dataset")
+    parser.add_argument("--timeout", type=float, help="giới hạn thời gian (s) cho mỗi case")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="file kết quả cũ để so sánh")
+    parser.add_argument("--save-baseline", help="ghi thêm kết quả lần này làm baseline")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or args.warmup < 0:
+        parser.error("--repeat phải >= 1 và --warmup phải >= 0")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    datasets = available_datasets()
+    names = args.datasets or list(datasets)
+    unknown = [name for name in names if name not in datasets]
+    if unknown:
+        print(f"Không tìm thấy dataset: {', '.join(unknown)} (có: {', '.join(datasets)})", file=sys.stderr)
+        return 2
+
+    results = []
+    for name in names:
+        profits_source = prepare_profits(name, datasets[name])
+        for algorithm in args.algorithms:
+            case = {"dataset": name, "path": os.path.abspath(datasets[name]), "work_dir": WORK_DIR,
+                    "algorithm": algorithm,
+                    "minutil": args.minutil, "mincor": args.mincor, "maxlen": args.maxlen,
+                    "warmup": args.warmup, "repeat": args.repeat, "max_transactions": args.max_transactions}
+            measured = run_case(case, args.timeout)
+            if "error" in measured:
+                print(f"[{name}] {algorithm}: lỗi: {measured['error']}")
+            else:
+                print(f"[{name}] {algorithm}: median {measured['median']:.3f}s, {measured['patterns']} pattern, "
+                      f"traced {measured['peak_traced_mb']:.1f} MB, RSS {measured['peak_rss_mb']} MB")
+            result = {key: case[key] for key in ("dataset", "algorithm", "minutil", "mincor", "maxlen")}
+            result["profits"] = profits_source
+            result.update(measured)
+            results.append(result)
+
+    report = {
+        "version": BENCHMARK_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {"warmup": args.warmup, "repeat": args.repeat, "max_transactions": args.max_transactions},
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi kết quả vào: {args.output}")
+
+    exit_code = 1 if any("error" in r for r in results) else 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("version") != BENCHMARK_VERSION:
+            print(f"Warning: baseline phiên bản {baseline.get('version')}, hiện tại {BENCHMARK_VERSION}",
+                  file=sys.stderr)
+        if baseline.get("environment", {}).get("platform") != report["environment"]["platform"]:
+            print("Warning: baseline đo trên môi trường khác, so sánh thời gian có thể không chính xác",
+                  file=sys.stderr)
+        rows = compare(results, baseline, args.time_threshold, args.memory_threshold)
+        print()
+        print_comparison(rows)
+        if any(row["regression"] for row in rows):
+            print("Có hồi quy so với baseline")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
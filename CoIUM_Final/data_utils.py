@@ -1,38 +1,152 @@
+import hashlib
+import itertools
+import json
 import os
 import sys
 import numpy as np
+from multiprocessing import shared_memory
 
-def load_dataset(file_path):
-    """Tải dataset từ file và chuyển đổi thành định dạng phù hợp"""
+# Phiên bản định dạng cache nhị phân của dataset (tăng khi đổi cách parse/lưu)
+DATASET_CACHE_VERSION = 1
+
+
+def _parse_line(line, is_csv):
+    """Tách một dòng text thành list item (int)"""
+    if is_csv:
+        line = line.strip().split(',')[0]
+    return [int(x) for x in line.strip().split() if x.isdigit()]
+
+
+def _parse_dataset_file(file_path):
+    """Parse file text .dat/.csv thành list of lists"""
     dataset = []
+    is_csv = file_path.endswith('.csv')
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                items = _parse_line(line, is_csv)
+                if items:
+                    dataset.append(items)
+    except IOError as e:
+        raise IOError(f"Lỗi khi đọc file {file_path}: {str(e)}")
+    return dataset
+
+
+def _dataset_cache_paths(file_path):
+    return f"{file_path}.indptr.npy", f"{file_path}.indices.npy", f"{file_path}.meta.json"
+
+
+def _file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_dataset_cache(file_path):
+    """
+    Nạp cache CSR (.npy, mmap) nếu còn hợp lệ. Cache hợp lệ khi cùng phiên bản
+    và cùng mtime/kích thước với file nguồn; nếu chỉ mtime đổi thì so sánh hash
+    nội dung, trùng thì cập nhật lại mtime trong meta.
+    """
+    indptr_path, indices_path, meta_path = _dataset_cache_paths(file_path)
+    if not all(os.path.exists(p) for p in (indptr_path, indices_path, meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        stat = os.stat(file_path)
+        if meta.get('version') != DATASET_CACHE_VERSION or meta.get('size') != stat.st_size:
+            return None
+        if meta.get('mtime_ns') != stat.st_mtime_ns:
+            if meta.get('sha256') != _file_sha256(file_path):
+                return None
+            meta['mtime_ns'] = stat.st_mtime_ns
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        return CSRDataset(np.load(indptr_path, mmap_mode='r'), np.load(indices_path, mmap_mode='r'))
+    except (OSError, ValueError) as e:
+        print(f"Bỏ qua cache dataset {file_path}: {e}", file=sys.stderr)
+        return None
+
+
+def _save_dataset_cache(file_path, csr):
+    """Lưu CSR thành các file .npy cạnh file nguồn (ghi file tạm rồi đổi tên)"""
+    indptr_path, indices_path, meta_path = _dataset_cache_paths(file_path)
+    stat = os.stat(file_path)
+    meta = {
+        'version': DATASET_CACHE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': _file_sha256(file_path),
+    }
+    try:
+        for path, array_ in ((indptr_path, csr.indptr), (indices_path, csr.indices)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array_))
+            os.replace(tmp_path, path)
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+    except OSError as e:
+        print(f"Không ghi được cache dataset {file_path}: {e}", file=sys.stderr)
+
+
+def iter_transaction_batches(file_path, batch_size=10000):
+    """
+    Đọc dataset theo từng lô cố định batch_size transaction (generator), để xử
+    lý file lớn hơn RAM: bộ nhớ đỉnh chỉ phụ thuộc kích thước lô. Mỗi lần gọi
+    lại hàm sẽ đọc lại file từ đầu (dùng cho thuật toán nhiều lượt).
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size phải > 0")
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Không tìm thấy file: {file_path}")
 
+    is_csv = file_path.endswith('.csv')
+    batch = []
     try:
-        if file_path.endswith('.csv'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    first_column = line.strip().split(',')[0]
-                    items = [int(x) for x in first_column.strip().split() if x.isdigit()]
-                    if items:
-                        dataset.append(items)
-        else:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    items = [int(x) for x in line.strip().split() if x.isdigit()]
-                    if items:
-                        dataset.append(items)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                items = _parse_line(line, is_csv)
+                if items:
+                    batch.append(items)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
     except IOError as e:
         raise IOError(f"Lỗi khi đọc file {file_path}: {str(e)}")
+    if batch:
+        yield batch
 
-    if not dataset:
-        raise ValueError(f"Dataset {file_path} trống hoặc không hợp lệ.")
 
-    for trans in dataset:
-        if not all(isinstance(x, int) for x in trans):
-            raise ValueError(f"Dataset {file_path} chứa giá trị không phải số nguyên.")
+def load_dataset(file_path, as_csr=False, use_cache=True):
+    """
+    Tải dataset từ file và chuyển đổi thành định dạng phù hợp.
+    Lần đầu file text được parse và lưu cache nhị phân CSR (.npy) cạnh file;
+    các lần sau cache được nạp bằng np.load(mmap_mode='r') (không parse lại).
+    as_csr=True trả về CSRDataset trên memmap thay vì list of lists.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Không tìm thấy file: {file_path}")
 
-    return dataset
+    csr = _load_dataset_cache(file_path) if use_cache else None
+    if csr is None:
+        dataset = _parse_dataset_file(file_path)
+        if not dataset:
+            raise ValueError(f"Dataset {file_path} trống hoặc không hợp lệ.")
+        csr = CSRDataset.from_transactions(dataset)
+        if use_cache:
+            _save_dataset_cache(file_path, csr)
+        if not as_csr:
+            return dataset
+
+    if not len(csr):
+        raise ValueError(f"Dataset {file_path} trống hoặc không hợp lệ.")
+    return csr if as_csr else csr.to_lists()
 
 
 def save_profits_to_file(profits, dataset_name):
@@ -75,4 +189,196 @@ def generate_profits(items, min_profit=1, max_profit=5):
         raise ValueError("max_profit phải >= min_profit")
 
     random_values = np.random.randint(min_profit, max_profit + 1, len(items))
-    return dict(zip(items, random_values))
\ No newline at end of file
+    return dict(zip(items, random_values))
+
+
+class CSRDataset:
+    """
+    Dataset dạng CSR: transaction t gồm indices[indptr[t]:indptr[t+1]],
+    utilities (tùy chọn) là utility tương ứng của từng phần tử.
+    Dùng được ở mọi chỗ nhận list of lists (len, duyệt, truy cập theo tid đều
+    trả về list int). Sau share(), ba mảng nằm trong multiprocessing.shared_memory;
+    khi pickle (gửi sang worker) chỉ tên vùng nhớ được gửi, worker attach zero-copy.
+    """
+    __slots__ = ('indptr', 'indices', 'utilities', '_shm')
+
+    def __init__(self, indptr, indices, utilities=None, shm=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.utilities = utilities
+        self._shm = shm
+
+    @classmethod
+    def from_transactions(cls, dataset, profits=None):
+        """Chuyển list of lists thành CSR; nếu có profits thì lưu thêm cột utilities"""
+        if isinstance(dataset, cls):
+            return dataset
+        indptr = np.zeros(len(dataset) + 1, dtype=np.int64)
+        np.cumsum([len(trans) for trans in dataset], out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(dataset), dtype=np.int64, count=int(indptr[-1]))
+        utilities = None
+        if profits is not None:
+            utilities = np.asarray([profits.get(i, 0) for i in indices.tolist()])
+            if utilities.dtype.kind not in 'iuf':
+                utilities = utilities.astype(np.float64)
+        return cls(indptr, indices, utilities)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, tid):
+        if tid < 0:
+            tid += len(self)
+        return self.indices[self.indptr[tid]:self.indptr[tid + 1]].tolist()
+
+    def to_lists(self):
+        """Chuyển về list of lists"""
+        flat = self.indices.tolist()
+        bounds = self.indptr.tolist()
+        return [flat[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def __iter__(self):
+        indices = self.indices
+        bounds = self.indptr.tolist()
+        for start, end in zip(bounds, bounds[1:]):
+            yield indices[start:end].tolist()
+
+    def rows_containing(self, item):
+        """Các tid (tăng dần) của transaction chứa item"""
+        positions = np.flatnonzero(self.indices == item)
+        return np.unique(np.searchsorted(self.indptr, positions, side='right') - 1)
+
+    def transactions_containing(self, item):
+        return [self[tid] for tid in self.rows_containing(item).tolist()]
+
+    def support(self, itemset):
+        """Số transaction chứa toàn bộ itemset (tính vector hóa trên CSR)"""
+        rows = None
+        for item in set(itemset):
+            item_rows = self.rows_containing(item)
+            rows = item_rows if rows is None else np.intersect1d(rows, item_rows, assume_unique=True)
+            if not len(rows):
+                return 0
+        return 0 if rows is None else len(rows)
+
+    # --- Shared memory -------------------------------------------------------
+
+    def share(self):
+        """Sao chép dataset vào một vùng shared memory mới và trả về CSRDataset trên vùng đó"""
+        arrays = [self.indptr, self.indices] + ([self.utilities] if self.utilities is not None else [])
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(a.nbytes for a in arrays)))
+        views = []
+        offset = 0
+        for array_ in arrays:
+            view = np.ndarray(array_.shape, dtype=array_.dtype, buffer=shm.buf, offset=offset)
+            view[:] = array_
+            views.append(view)
+            offset += array_.nbytes
+        return CSRDataset(views[0], views[1], views[2] if len(views) > 2 else None, shm)
+
+    def handle(self):
+        """Thông tin đủ để attach: (tên vùng nhớ, số transaction, số phần tử, dtype utilities)"""
+        if self._shm is None:
+            raise ValueError("Dataset chưa nằm trong shared memory, gọi share() trước")
+        utilities_dtype = self.utilities.dtype.str if self.utilities is not None else None
+        return self._shm.name, len(self), len(self.indices), utilities_dtype
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach (zero-copy) vào dataset đã share() ở tiến trình khác theo tên"""
+        name, n_transactions, nnz, utilities_dtype = handle
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 không có tham số track
+            shm = shared_memory.SharedMemory(name=name)
+        indptr = np.ndarray((n_transactions + 1,), dtype=np.int64, buffer=shm.buf)
+        indices = np.ndarray((nnz,), dtype=np.int64, buffer=shm.buf, offset=indptr.nbytes)
+        utilities = None
+        if utilities_dtype is not None:
+            utilities = np.ndarray((nnz,), dtype=np.dtype(utilities_dtype), buffer=shm.buf,
+                                   offset=indptr.nbytes + indices.nbytes)
+        return cls(indptr, indices, utilities, shm)
+
+    def __reduce__(self):
+        if self._shm is not None:
+            return CSRDataset.attach, (self.handle(),)
+        return CSRDataset, (self.indptr, self.indices, self.utilities)
+
+    def close(self):
+        """Bỏ các view rồi đóng vùng shared memory ở tiến trình hiện tại"""
+        if self._shm is not None:
+            self.indptr = self.indices = self.utilities = None
+            self._shm.close()
+
+    def unlink(self):
+        """Giải phóng vùng shared memory (chỉ tiến trình tạo ra nó gọi)"""
+        if self._shm is not None:
+            self._shm.unlink()
+
+
+def transactions_containing(dataset, item):
+    """Các transaction chứa item, dùng được cho cả list of lists và CSRDataset"""
+    if isinstance(dataset, CSRDataset):
+        return dataset.transactions_containing(item)
+    return [trans for trans in dataset if item in trans]
+
+
+class WeightedDataset(list):
+    """
+    Dataset đã nén (compact_dataset): mỗi phần tử là một transaction phân biệt
+    (item đã sắp xếp, không trùng lặp), weights[t] là số đơn hàng gốc giống hệt
+    transaction t. Vẫn là list of lists nên dùng được ở mọi chỗ nhận dataset;
+    các bảng TWU/support, Utility-List và thuật toán nhân mọi đóng góp của
+    transaction với trọng số của nó.
+    """
+
+    def __init__(self, transactions=(), weights=None):
+        super().__init__(transactions)
+        self.weights = list(weights) if weights is not None else [1] * len(self)
+        if len(self.weights) != len(self):
+            raise ValueError("Số trọng số phải bằng số transaction")
+
+    @property
+    def n_transactions(self):
+        """Số transaction gốc (tổng trọng số)"""
+        return sum(self.weights)
+
+    def compression_report(self):
+        n_rows = len(self)
+        n_transactions = self.n_transactions
+        return {
+            "transactions": n_transactions,
+            "distinct_transactions": n_rows,
+            "compression_ratio": round(n_transactions / n_rows, 4) if n_rows else 1.0,
+        }
+
+
+def compact_dataset(dataset, verbose=False):
+    """
+    Nén dataset: bỏ item trùng lặp trong cùng transaction (utility của item
+    trong transaction chỉ tính một lần, giống Utility-List) và gộp các
+    transaction giống hệt nhau thành một dòng có trọng số. Khối lượng công
+    việc của thuật toán khi đó tỉ lệ với số giỏ hàng phân biệt.
+    Lưu ý: TU của transaction có item lặp giảm theo, nên minutil tương đối
+    được tính trên tổng utility sau khi bỏ trùng.
+    """
+    weights = transaction_weights(dataset)
+    rows = {}
+    for tid, trans in enumerate(dataset):
+        if not trans:
+            continue
+        key = tuple(sorted(set(trans)))
+        rows[key] = rows.get(key, 0) + (weights[tid] if weights is not None else 1)
+
+    compacted = WeightedDataset([list(key) for key in rows], rows.values())
+    if verbose:
+        report = compacted.compression_report()
+        print(f"Nén dataset: {report['transactions']} transactions -> {report['distinct_transactions']} "
+              f"dòng phân biệt (tỉ lệ {report['compression_ratio']}x)", file=sys.stderr)
+    return compacted
+
+
+def transaction_weights(dataset):
+    """Trọng số của từng transaction (None nếu dataset không có trọng số, tức mọi trọng số = 1)"""
+    return getattr(dataset, 'weights', None)
+
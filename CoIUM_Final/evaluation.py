@@ -1,19 +1,75 @@
+import sys
+import threading
 import time
 import psutil
 import numpy as np
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Chu kỳ lấy mẫu RSS (giây) khi hệ điều hành không cung cấp peak theo lần gọi
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def peak_rss_mb():
+    """
+    Peak RSS của tiến trình hiện tại từ khi khởi động (MB): ru_maxrss trên
+    Linux/macOS, peak_wset trên Windows; None nếu không đo được.
+    """
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về byte
+        return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+    info = psutil.Process().memory_info()
+    peak = getattr(info, 'peak_wset', None)
+    return peak / 1024 / 1024 if peak is not None else None
+
+
+class _RSSSampler:
+    """Luồng nền ghi lại RSS lớn nhất của tiến trình trong lúc đo"""
+
+    def __init__(self, process, interval=RSS_SAMPLE_INTERVAL):
+        self.process = process
+        self.interval = interval
+        self.peak = process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
 def measure_performance(func, *args, **kwargs):
+    """
+    Chạy func một lần, trả về (thời gian (s), bộ nhớ tăng thêm lúc đỉnh (MB), kết quả).
+    Bộ nhớ đỉnh là RSS lớn nhất trong lúc chạy (lấy mẫu định kỳ, chạy được
+    trên mọi hệ điều hành) trừ RSS lúc bắt đầu. Số đo chính xác hơn, lặp lại
+    nhiều lần trong tiến trình riêng: xem benchmark.py.
+    """
     process = psutil.Process()
     start_mem = process.memory_info().rss / 1024 / 1024
-    start = time.time()
-    try:
-        result = func(*args, **kwargs)
-    except Exception as e:
-        print(f"Lỗi khi chạy {func.__name__}: {str(e)}")
-        result = []
-    end = time.time()
+    with _RSSSampler(process) as sampler:
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            print(f"Lỗi khi chạy {func.__name__}: {str(e)}")
+            result = []
+        end = time.time()
     end_mem = process.memory_info().rss / 1024 / 1024
-    peak_mem = (process.memory_info().peak_wset / 1024 / 1024) - start_mem
+    peak_mem = sampler.peak / 1024 / 1024 - start_mem
     return round(end - start, 2), round(max(end_mem - start_mem, peak_mem), 2), result
 
 
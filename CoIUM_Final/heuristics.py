@@ -1,8 +1,13 @@
-from metrics import calculate_twu, calculate_correlation
+from metrics import calculate_correlation, get_twu_table
 
-def twu_pruning(item, dataset, profits, minutil):
-    twu = calculate_twu(item, dataset, profits)
-    return twu >= minutil
+def twu_pruning(item, dataset, profits, minutil, twu_table=None):
+    if twu_table is None:
+        twu_table = get_twu_table(dataset, profits)
+    return twu_table.get(item) >= minutil
+
+def eucs_pruning(item_a, item_b, twu_table, minutil):
+    """Giữ lại phần mở rộng chứa cặp {a, b} chỉ khi TWU của cặp trong EUCS >= minutil"""
+    return twu_table.pair_twu(item_a, item_b) >= minutil
 
 def correlation_pruning(itemset, supports, mincor):
     if len(itemset) < 2:
@@ -4,7 +4,7 @@ from algorithms.coium import coium
 from algorithms.coup_miner import coup_miner
 from algorithms.cohui_miner import cohui_miner
 from evaluation import measure_performance, analyze_results, calculate_stability_score
-from metrics import calculate_transaction_utility
+from metrics import get_twu_table
 from visualization import (
     create_dataset_charts,
     create_final_summary_charts
@@ -55,7 +55,7 @@ def run_comprehensive_experiments():
             save_profits_to_file(profits, name)
 
         # TÍNH TỔNG TU DỰA TRÊN PROFITS VÀ HÀM CHUẨN
-        tu_total = sum(calculate_transaction_utility(trans, profits) for trans in data)
+        tu_total = get_twu_table(data, profits).total_utility
 
         print(f"[{name}] Tổng TU = {tu_total:.2f}")
         print(f"[{name}] Số items = {len(items)}")
@@ -1,26 +1,210 @@
 import itertools
-from collections import defaultdict
+from collections import Counter, defaultdict
+from data_utils import CSRDataset, transaction_weights
 
 def calculate_transaction_utility(trans, profits):
     return sum(profits.get(i, 0) for i in trans)
 
+class TWUTable:
+    """
+    Bảng TWU của mọi item, tính trong một lượt duyệt dataset.
+    Transaction utility (TU) của từng transaction được cache lại để dùng chung.
+    Nếu with_eucs=True, cùng lượt duyệt đó xây thêm EUCS (Estimated Utility
+    Co-occurrence Structure): TWU của từng cặp item cùng xuất hiện, khóa (a, b), a < b.
+    Bảng có thể được cập nhật dần theo từng lô transaction (update); khi đọc
+    streaming, đặt keep_transaction_utilities=False để bộ nhớ không tăng theo
+    số transaction.
+    """
+    __slots__ = ('twu', 'eucs', 'transaction_utilities', 'total_utility')
+
+    def __init__(self, with_eucs=False, keep_transaction_utilities=True):
+        self.twu = defaultdict(int)
+        self.eucs = defaultdict(int) if with_eucs else None
+        self.transaction_utilities = [] if keep_transaction_utilities else None
+        self.total_utility = 0
+
+    @classmethod
+    def build(cls, dataset, profits, with_eucs=False):
+        table = cls(with_eucs)
+        table.update(dataset, profits, transaction_weights(dataset))
+        return table
+
+    @classmethod
+    def build_from_batches(cls, batches, profits, with_eucs=False):
+        """Xây bảng từ các lô transaction (vd. data_utils.iter_transaction_batches)"""
+        table = cls(with_eucs, keep_transaction_utilities=False)
+        for batch in batches:
+            table.update(batch, profits)
+        return table
+
+    def update(self, transactions, profits, weights=None):
+        """
+        Cộng thêm TU/TWU (và EUCS) của các transaction mới vào bảng.
+        weights[t] là số lần lặp của transaction t (dataset đã nén); TU lưu
+        trong transaction_utilities là TU của một lần xuất hiện.
+        """
+        twu, eucs = self.twu, self.eucs
+        for tid, trans in enumerate(transactions):
+            tu = calculate_transaction_utility(trans, profits)
+            if self.transaction_utilities is not None:
+                self.transaction_utilities.append(tu)
+            if weights is not None:
+                tu *= weights[tid]
+            self.total_utility += tu
+            unique_items = sorted(set(trans))
+            for item in unique_items:
+                twu[item] += tu
+            if eucs is not None:
+                for pair in itertools.combinations(unique_items, 2):
+                    eucs[pair] += tu
+
+    def get(self, item):
+        return self.twu.get(item, 0)
+
+    def pair_twu(self, item_a, item_b):
+        """TWU của cặp {a, b} theo EUCS (0 nếu hai item chưa từng cùng xuất hiện)"""
+        key = (item_a, item_b) if item_a < item_b else (item_b, item_a)
+        return self.eucs.get(key, 0)
+
+
+# Cache các TWUTable đã tính, khóa theo đối tượng dataset
+_twu_table_cache = {}
+_TWU_TABLE_CACHE_SIZE = 4
+
+
+def get_twu_table(dataset, profits, with_eucs=False):
+    """
+    Trả về TWUTable của (dataset, profits), tái sử dụng bảng đã tính nếu cùng
+    đối tượng dataset (số transaction không đổi) và cùng nội dung profits.
+    """
+    cached = _twu_table_cache.get(id(dataset))
+    if cached is not None:
+        cached_dataset, cached_profits, n_trans, table = cached
+        if (cached_dataset is dataset and n_trans == len(dataset) and cached_profits == profits
+                and (table.eucs is not None or not with_eucs)):
+            return table
+
+    table = TWUTable.build(dataset, profits, with_eucs)
+    _twu_table_cache.pop(id(dataset), None)
+    if len(_twu_table_cache) >= _TWU_TABLE_CACHE_SIZE:
+        _twu_table_cache.pop(next(iter(_twu_table_cache)))
+    # Giữ tham chiếu tới dataset để id() không bị tái sử dụng
+    _twu_table_cache[id(dataset)] = (dataset, dict(profits), len(dataset), table)
+    return table
+
+
+# Cache các CooccurrenceTable đã tính, khóa theo đối tượng dataset
+_cooccurrence_table_cache = {}
+
+
+def get_cooccurrence_table(dataset):
+    """
+    Trả về CooccurrenceTable của dataset, tái sử dụng bảng đã tính nếu cùng
+    đối tượng dataset và số transaction không đổi.
+    """
+    cached = _cooccurrence_table_cache.get(id(dataset))
+    if cached is not None and cached[0] is dataset and cached[1] == len(dataset):
+        return cached[2]
+
+    table = CooccurrenceTable.build(dataset)
+    _cooccurrence_table_cache.pop(id(dataset), None)
+    if len(_cooccurrence_table_cache) >= _TWU_TABLE_CACHE_SIZE:
+        _cooccurrence_table_cache.pop(next(iter(_cooccurrence_table_cache)))
+    # Giữ tham chiếu tới dataset để id() không bị tái sử dụng
+    _cooccurrence_table_cache[id(dataset)] = (dataset, len(dataset), table)
+    return table
+
+
+def clear_table_caches():
+    """Xóa các bảng TWU / co-occurrence đã cache (vd. để đo lại từ đầu trong benchmark)"""
+    _twu_table_cache.clear()
+    _cooccurrence_table_cache.clear()
+
+
 def calculate_twu(item, dataset, profits):
-    twu = 0
-    for trans in dataset:
-        if item in trans:
-            twu += calculate_transaction_utility(trans, profits)
-    return twu
+    return get_twu_table(dataset, profits).get(item)
 
 def calculate_support(dataset, itemset):
+    if isinstance(dataset, CSRDataset):
+        return dataset.support(itemset) if itemset else 0
     if not dataset or not itemset:
         return 0
     itemset = set(itemset)
+    weights = transaction_weights(dataset)
+    if weights is not None:
+        return sum(w for trans, w in zip(dataset, weights) if itemset.issubset(trans))
     return sum(itemset.issubset(trans) for trans in dataset)
 
+class CooccurrenceTable:
+    """
+    Bảng support của từng item và từng cặp item, xây dựng trong một lượt
+    duyệt dataset. Cặp được lưu thưa (chỉ các cặp thực sự cùng xuất hiện)
+    với khóa (a, b), a < b, nên bộ nhớ tỉ lệ với số cặp đồng xuất hiện.
+    """
+    __slots__ = ('item_supports', 'pair_supports', 'n_transactions')
+
+    def __init__(self):
+        self.item_supports = Counter()
+        self.pair_supports = Counter()
+        self.n_transactions = 0
+
+    @classmethod
+    def build(cls, dataset):
+        table = cls()
+        table.update(dataset, transaction_weights(dataset))
+        return table
+
+    @classmethod
+    def build_from_batches(cls, batches):
+        """Xây bảng từ các lô transaction (vd. data_utils.iter_transaction_batches)"""
+        table = cls()
+        for batch in batches:
+            table.update(batch)
+        return table
+
+    def update(self, transactions, weights=None):
+        """Cộng thêm support của các transaction mới vào bảng (weights: số lần lặp của từng transaction)"""
+        item_supports, pair_supports = self.item_supports, self.pair_supports
+        for tid, trans in enumerate(transactions):
+            unique_items = sorted(set(trans))
+            if weights is None:
+                item_supports.update(unique_items)
+                pair_supports.update(itertools.combinations(unique_items, 2))
+                self.n_transactions += 1
+                continue
+            weight = weights[tid]
+            for item in unique_items:
+                item_supports[item] += weight
+            for pair in itertools.combinations(unique_items, 2):
+                pair_supports[pair] += weight
+            self.n_transactions += weight
+
+    def support(self, item):
+        return self.item_supports.get(item, 0)
+
+    def pair_support(self, item_a, item_b):
+        key = (item_a, item_b) if item_a < item_b else (item_b, item_a)
+        return self.pair_supports.get(key, 0)
+
+    def get(self, itemset, default=0):
+        """Tương thích với bảng supports cũ khóa bằng frozenset (1 hoặc 2 item)"""
+        items = list(itemset)
+        if len(items) == 1:
+            return self.item_supports.get(items[0], default)
+        if len(items) == 2:
+            return self.pair_support(items[0], items[1]) or default
+        raise KeyError("CooccurrenceTable chỉ lưu support của item đơn và cặp item")
+
+
 def calculate_kulc_pair(item_a, item_b, supports):
-    sup_a = supports.get(frozenset([item_a]), 0)
-    sup_b = supports.get(frozenset([item_b]), 0)
-    sup_ab = supports.get(frozenset([item_a, item_b]), 0)
+    if isinstance(supports, CooccurrenceTable):
+        sup_a = supports.support(item_a)
+        sup_b = supports.support(item_b)
+        sup_ab = supports.pair_support(item_a, item_b)
+    else:
+        sup_a = supports.get(frozenset([item_a]), 0)
+        sup_b = supports.get(frozenset([item_b]), 0)
+        sup_ab = supports.get(frozenset([item_a, item_b]), 0)
     if sup_a == 0 or sup_b == 0 or sup_ab == 0:
         return 0.0
     return 0.5 * ((sup_ab / sup_a) + (sup_ab / sup_b))
@@ -0,0 +1,107 @@
+"""
+Chỉ mục láng giềng theo sản phẩm, xây một lần cho mỗi kết quả khai thác:
+- Gợi ý chung và gợi ý cho một sản phẩm được tính sẵn (tra dict)
+- Gợi ý cho nhiều sản phẩm dùng posting list sản phẩm -> pattern, chỉ duyệt
+  các pattern chứa ít nhất một sản phẩm đích
+Điểm số, thứ tự (kể cả khi bằng điểm) giống hệt cách tính trực tiếp trên
+toàn bộ pattern trong recommendation_service.
+"""
+
+INDEX_VERSION = 1
+
+# Hệ số ưu tiên cho sản phẩm đi cùng sản phẩm đích
+RELATED_BOOST = 1.5
+
+
+class NeighborIndex:
+    """
+    patterns: list (itemset, utility, correlation) giảm dần theo utility.
+    global_ranking: gợi ý khi không có sản phẩm đích.
+    neighbors: sản phẩm -> gợi ý khi sản phẩm đó là sản phẩm đích duy nhất.
+    postings: sản phẩm -> chỉ số các pattern chứa nó (tăng dần).
+    Mỗi gợi ý là tuple (productID, score, frequency, confidence).
+    """
+    __slots__ = ('patterns', 'global_ranking', 'neighbors', 'postings')
+
+    def __init__(self, patterns, global_ranking, neighbors, postings):
+        self.patterns = patterns
+        self.global_ranking = global_ranking
+        self.neighbors = neighbors
+        self.postings = postings
+
+    @classmethod
+    def build(cls, cohuis):
+        patterns = sorted(cohuis, key=lambda x: x[1], reverse=True)
+        postings = {}
+        for pattern_id, (itemset, _, _) in enumerate(patterns):
+            for product_id in itemset:
+                postings.setdefault(product_id, []).append(pattern_id)
+
+        index = cls(patterns, [], {}, postings)
+        index.global_ranking = index._rank(range(len(patterns)), None)
+        index.neighbors = {product_id: index._rank(pattern_ids, (product_id,))
+                           for product_id, pattern_ids in postings.items()}
+        return index
+
+    @property
+    def n_patterns(self):
+        return len(self.patterns)
+
+    def recommend(self, target_products=None, top_n=10):
+        """Trả về (top_n gợi ý, tổng số sản phẩm được gợi ý)"""
+        if not target_products:
+            ranking = self.global_ranking
+        else:
+            targets = set(target_products)
+            if len(targets) == 1:
+                ranking = self.neighbors.get(next(iter(targets)), [])
+            else:
+                pattern_ids = set()
+                for product_id in targets:
+                    pattern_ids.update(self.postings.get(product_id, ()))
+                ranking = self._rank(sorted(pattern_ids), targets)
+        return ranking[:top_n], len(ranking)
+
+    def _rank(self, pattern_ids, targets):
+        """Xếp hạng sản phẩm trên các pattern pattern_ids (targets=None: không có sản phẩm đích)"""
+        scores = {}
+        counts = {}
+        boost = 1 if targets is None else RELATED_BOOST
+        for pattern_id in pattern_ids:
+            itemset, utility, correlation = self.patterns[pattern_id]
+            # Trọng số kết hợp utility và correlation
+            score = utility * correlation * boost
+            for product_id in itemset:
+                if targets is not None and product_id in targets:
+                    continue
+                scores[product_id] = scores.get(product_id, 0.0) + score
+                counts[product_id] = counts.get(product_id, 0) + 1
+
+        n_patterns = len(self.patterns)
+        ranking = [(product_id, round(total / counts[product_id], 2), counts[product_id],
+                    round(min(counts[product_id] / n_patterns * 100, 100), 2))
+                   for product_id, total in scores.items()]
+        ranking.sort(key=lambda x: x[1], reverse=True)
+        return ranking
+
+    def to_dict(self):
+        """Dạng JSON được (khóa dict JSON là chuỗi nên map được lưu thành list cặp)"""
+        return {
+            "version": INDEX_VERSION,
+            "patterns": [[list(itemset), utility, correlation] for itemset, utility, correlation in self.patterns],
+            "global": [list(entry) for entry in self.global_ranking],
+            "neighbors": [[product_id, [list(entry) for entry in ranking]]
+                          for product_id, ranking in self.neighbors.items()],
+            "postings": [[product_id, pattern_ids] for product_id, pattern_ids in self.postings.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Phiên bản chỉ mục không hỗ trợ: {data.get('version')}")
+        return cls(
+            [(itemset, utility, correlation) for itemset, utility, correlation in data["patterns"]],
+            [tuple(entry) for entry in data["global"]],
+            {product_id: [tuple(entry) for entry in ranking] for product_id, ranking in data["neighbors"]},
+            {product_id: pattern_ids for product_id, pattern_ids in data["postings"]},
+        )
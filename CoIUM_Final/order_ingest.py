@@ -0,0 +1,262 @@
+"""
+Nạp đơn hàng cho recommendation_service mà không giữ toàn bộ payload trong bộ nhớ:
+- OrderTable: transactions + profits xây trong một lượt duyệt đơn hàng
+- read_request: parse request JSON từ stream theo từng chunk, mảng "orders"
+  được đọc từng phần tử (json.JSONDecoder.raw_decode) và đưa thẳng vào
+  OrderTable, không tạo list dict đơn hàng
+- Payload dạng cột (columnar) thay cho list object đơn hàng dài dòng:
+  {
+      "productIDs": [101, 102, ...],   # từ điển sản phẩm
+      "prices": [500000, 300000, ...], # giá theo từng sản phẩm trong productIDs
+      "offsets": [0, 2, 3, ...],       # đơn hàng k gồm items[offsets[k]:offsets[k + 1]]
+      "items": [0, 1, 0, ...],         # chỉ số trong productIDs
+      "timestamps": [...]              # (tùy chọn) thời điểm của từng đơn hàng
+  }
+Thời điểm đơn hàng (trường "orderDate" của đơn hàng dạng object) là chuỗi
+ISO 8601 hoặc số mili giây từ epoch (Date của JavaScript).
+"""
+
+import io
+import json
+from datetime import datetime, timezone
+
+JSON_WHITESPACE = ' \t\n\r'
+
+
+class RequestError(ValueError):
+    """
+    Request JSON đọc được trọn vẹn nhưng có dữ liệu không hợp lệ (vd. một đơn
+    hàng sai dạng); request_id là trường "id" của request (nếu có) để phía
+    gọi vẫn ghép được response lỗi với request.
+    """
+
+    def __init__(self, message, request_id=None):
+        super().__init__(message)
+        self.request_id = request_id
+
+
+class OrderTable:
+    """
+    Đơn hàng đã nạp: transactions là list productID đã sắp xếp, không trùng
+    lặp của từng đơn (bỏ đơn rỗng, giữ thứ tự đơn); timestamps[t] là thời
+    điểm gốc (orderDate chưa parse, None nếu không có) của transaction t, chỉ
+    được parse (parse_timestamp) khi dùng cửa sổ thời gian; profits là giá
+    lần đầu gặp của mỗi sản phẩm. Hai bảng bằng nhau khi cùng transactions và profits.
+    """
+
+    def __init__(self):
+        self.transactions = []
+        self.timestamps = []
+        self.profits = {}
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __eq__(self, other):
+        if not isinstance(other, OrderTable):
+            return NotImplemented
+        return self.transactions == other.transactions and self.profits == other.profits
+
+    def add_order(self, order):
+        """Thêm một đơn hàng dạng {"orderID": ..., "items": [{"productID", "price", ...}]}"""
+        transaction = set()
+        for item in order.get('items') or ():
+            product_id = item.get('productID')
+            if product_id:
+                transaction.add(product_id)
+                # Đảm bảo mọi productID đều có profit
+                if product_id not in self.profits:
+                    self.profits[product_id] = item.get('price', 0)
+        if transaction:
+            self.transactions.append(sorted(transaction))
+            self.timestamps.append(order.get('orderDate'))
+
+    def add_columnar(self, payload):
+        """Thêm các đơn hàng từ payload dạng cột (xem đầu module)"""
+        product_ids = payload['productIDs']
+        prices = payload.get('prices') or [0] * len(product_ids)
+        offsets = payload['offsets']
+        items = payload['items']
+        timestamps = payload.get('timestamps')
+        if len(prices) != len(product_ids):
+            raise ValueError("prices và productIDs phải cùng độ dài")
+        if not offsets or offsets[0] != 0 or offsets[-1] != len(items):
+            raise ValueError("offsets phải bắt đầu từ 0 và kết thúc bằng len(items)")
+        if timestamps is not None and len(timestamps) != len(offsets) - 1:
+            raise ValueError("timestamps phải có đúng một giá trị cho mỗi đơn hàng")
+
+        for k in range(len(offsets) - 1):
+            start, end = offsets[k], offsets[k + 1]
+            if end < start:
+                raise ValueError(f"offsets giảm tại đơn hàng {k}")
+            transaction = set()
+            for index in items[start:end]:
+                if not 0 <= index < len(product_ids):
+                    raise ValueError(f"Chỉ số sản phẩm ngoài phạm vi: {index}")
+                product_id = product_ids[index]
+                if product_id:
+                    transaction.add(product_id)
+                    if product_id not in self.profits:
+                        self.profits[product_id] = prices[index]
+            if transaction:
+                self.transactions.append(sorted(transaction))
+                self.timestamps.append(timestamps[k] if timestamps is not None else None)
+
+    @classmethod
+    def from_orders(cls, orders):
+        table = cls()
+        for order in orders:
+            table.add_order(order)
+        return table
+
+    @classmethod
+    def from_columnar(cls, payload):
+        table = cls()
+        table.add_columnar(payload)
+        return table
+
+
+def parse_timestamp(value):
+    """Thời điểm (giây từ epoch, UTC) từ chuỗi ISO 8601 hoặc số mili giây; None nếu không có"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Thời điểm không hợp lệ: {value!r}")
+    if isinstance(value, (int, float)):
+        return value / 1000
+    try:
+        # fromisoformat của Python < 3.11 không nhận hậu tố 'Z'
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Thời điểm không hợp lệ: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def as_order_table(orders):
+    """OrderTable của orders: OrderTable giữ nguyên, dict là payload dạng cột, còn lại là list đơn hàng"""
+    if isinstance(orders, OrderTable):
+        return orders
+    if isinstance(orders, dict):
+        return OrderTable.from_columnar(orders)
+    return OrderTable.from_orders(orders)
+
+
+class _StreamDecoder:
+    """Đọc lần lượt các giá trị JSON từ text stream, chỉ giữ phần chưa parse trong bộ đệm"""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # Đọc ít nhất bằng phần đang dở để một giá trị lớn chỉ cần parse lại O(log) lần
+        chunk = self.stream.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Ký tự khác khoảng trắng tiếp theo ('' nếu hết stream)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"JSON không hợp lệ: cần một trong {chars!r}, gặp {ch or 'EOF'!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """Parse một giá trị JSON hoàn chỉnh tại vị trí hiện tại"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Số ở cuối bộ đệm có thể còn chữ số trong chunk sau
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def _read_orders(reader):
+    """
+    Đọc mảng đơn hàng từng phần tử một vào OrderTable. Trả về (table, lỗi
+    của đơn hàng hỏng đầu tiên hoặc None); gặp đơn hàng hỏng vẫn đọc hết mảng
+    để phần còn lại của request (vd. "id") vẫn được parse.
+    """
+    table = OrderTable()
+    error = None
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+        return table, error
+    while True:
+        order = reader.value()
+        if error is None:
+            try:
+                table.add_order(order)
+            except (AttributeError, TypeError, ValueError) as e:
+                error = ValueError(f"Đơn hàng không hợp lệ: {e}")
+        if reader.expect(',]') == ']':
+            return table, error
+
+
+def read_request(stream, chunk_size=1 << 16):
+    """
+    Parse request JSON (một object) từ text stream. Trường "orders" được trả
+    về dưới dạng OrderTable: mảng đơn hàng được nạp từng phần tử, object là
+    payload dạng cột. Trả về None nếu stream rỗng. Đơn hàng không hợp lệ gây
+    RequestError (kèm "id" của request), chỉ sau khi đã đọc hết object.
+    """
+    reader = _StreamDecoder(stream, chunk_size)
+    if not reader.peek():
+        return None
+    request = {}
+    order_error = None
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ValueError("JSON không hợp lệ: khóa phải là chuỗi")
+            reader.expect(':')
+            if key == 'orders' and reader.peek() == '[':
+                request[key], order_error = _read_orders(reader)
+            else:
+                request[key] = reader.value()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek():
+        raise ValueError("JSON không hợp lệ: còn dữ liệu sau object request")
+    try:
+        if order_error is not None:
+            raise order_error
+        if isinstance(request.get('orders'), dict):
+            request['orders'] = OrderTable.from_columnar(request['orders'])
+    except (KeyError, TypeError, ValueError) as e:
+        message = f"Thiếu trường {e}" if isinstance(e, KeyError) else str(e)
+        raise RequestError(message, request.get('id')) from e
+    return request
+
+
+def parse_request(text):
+    """read_request trên một chuỗi JSON đã có (vd. một dòng NDJSON)"""
+    return read_request(io.StringIO(text))
@@ -0,0 +1,34 @@
+"""
+Chạy song song các cây con prefix cấp 1 trên ProcessPoolExecutor
+(dùng chung cho CoIUM, CoUPM và CoHUI-Miner)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def resolve_workers(workers):
+    """workers=None hoặc 1 → chạy tuần tự; workers <= 0 → dùng toàn bộ CPU"""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def run_prefix_tasks(task, task_ids, weights, workers, initializer=None, initargs=()):
+    """
+    Chạy task(task_id) cho mọi task_id trên pool `workers` tiến trình.
+    - Largest-subtree-first: task có weight lớn nhất được gửi trước; pool giao
+      task kế tiếp cho tiến trình vừa rảnh nên tải được cân bằng động.
+    - Trạng thái dùng chung (dataset, Utility-List...) được gửi một lần cho mỗi
+      tiến trình qua initializer/initargs, task chỉ nhận task_id.
+    - Kết quả trả về theo đúng thứ tự task_ids để việc gộp là tất định.
+    """
+    order = sorted(range(len(task_ids)), key=lambda k: weights[k], reverse=True)
+    results = [None] * len(task_ids)
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        futures = [(pool.submit(task, task_ids[k]), k) for k in order]
+        for future, k in futures:
+            results[k] = future.result()
+    return results
@@ -3,12 +3,16 @@ CoHUI Recommendation Service for Fashion Store
 Dịch vụ gợi ý sản phẩm dựa trên thuật toán CoHUI
 """
 
+import re
 import sys
 import json
-from algorithms.coium import coium
-from data_utils import load_profits_from_file, generate_profits, save_profits_to_file
+from algorithms.coium import coium, IncrementalCoIUM
+from data_utils import load_profits_from_file, generate_profits, save_profits_to_file, compact_dataset
 from metrics import calculate_transaction_utility
-from collections import defaultdict
+from result_cache import ResultCache
+from neighbor_index import NeighborIndex
+from order_ingest import RequestError, as_order_table, parse_timestamp, read_request, parse_request
+from sliding_window import SlidingWindowMiner, decayed_dataset, window_rows
 import itertools
 
 
@@ -17,7 +21,8 @@ def prepare_dataset_from_orders(orders_data):
     Chuyển đổi dữ liệu đơn hàng từ MongoDB thành format cho CoHUI
     
     Args:
-        orders_data: List of orders, each containing items
+        orders_data: List of orders, each containing items (hoặc OrderTable /
+            payload dạng cột, xem order_ingest)
         Format: [
             {
                 "orderID": 1,
@@ -33,36 +38,187 @@ def prepare_dataset_from_orders(orders_data):
         dataset: List of transactions (mỗi transaction là list productID)
         profits: Dictionary mapping productID to price
     """
-    dataset = []
-    profits = {}
-    
-    # Bước 1: Thu thập tất cả products và profits
-    for order in orders_data:
-        if 'items' in order and order['items']:
-            for item in order['items']:
-                product_id = item.get('productID')
-                if product_id:
-                    price = item.get('price', 0)
-                    # Đảm bảo mọi productID đều có profit
-                    if product_id not in profits:
-                        profits[product_id] = price
-    
-    # Bước 2: Tạo dataset
-    for order in orders_data:
-        transaction = []
-        if 'items' in order and order['items']:
-            for item in order['items']:
-                product_id = item.get('productID')
-                if product_id:
-                    transaction.append(product_id)
-        
-        if transaction:
-            dataset.append(sorted(set(transaction)))  # Loại bỏ duplicate trong cùng 1 đơn
-    
-    return dataset, profits
+    # Transactions và profits được xây trong cùng một lượt duyệt đơn hàng
+    table = as_order_table(orders_data)
+    return table.transactions, table.profits
+
+
+# Dataset đã chuẩn bị của lần gọi trước: (OrderTable, dataset, profits).
+# Worker chạy lâu dài tái sử dụng khi orders không đổi giữa các request, nên
+# các bảng TWU/support đã cache theo dataset cũng được dùng lại.
+_last_prepared = None
+
+
+def prepare_compact_dataset(orders_data):
+    """prepare_dataset_from_orders + gộp các đơn hàng giống hệt nhau thành một dòng có trọng số"""
+    global _last_prepared
+    table = as_order_table(orders_data)
+    if _last_prepared is not None and _last_prepared[0] == table:
+        return _last_prepared[1], _last_prepared[2]
+    dataset = compact_dataset(table.transactions)
+    _last_prepared = (table, dataset, table.profits)
+    return dataset, table.profits
+
+
+# Cache kết quả khai thác: LRU trong tiến trình + file trên đĩa (cache/results)
+result_cache = ResultCache()
+
+
+# Miner tăng dần theo tham số (minutil, mincor, maxlen) -> (transactions đã áp dụng, IncrementalCoIUM)
+_incremental_miners = {}
+_INCREMENTAL_MINERS_SIZE = 4
+
+# Miner cửa sổ thời gian theo tham số (minutil, mincor, maxlen, window_days, half_life_days)
+_window_miners = {}
+
+
+def _target_key(target_items):
+    """Phần khóa cache của ràng buộc target (không phụ thuộc thứ tự / trùng lặp)"""
+    return None if target_items is None else sorted(set(target_items), key=str)
+
+
+def mine_cohuis(dataset, profits, minutil, mincor, maxlen, top_k_patterns=None, orders_data=None,
+                target_items=None, window=None):
+    """
+    Chạy CoIUM, hoặc lấy kết quả từ result_cache nếu dataset, profits và tham số không đổi.
+    Nếu có orders_data (và không dùng top-k), khai thác tăng dần: khi orders
+    là danh sách lần trước đã trượt (đơn cũ nhất rơi ra, đơn mới thêm vào
+    cuối), chỉ phần thay đổi được áp dụng (xem _mine_incremental).
+    target_items: chỉ khai thác CoHUI chứa ít nhất một item này (coium ràng
+    buộc target, chỉ duyệt các đơn hàng chứa target).
+    window: (rows, now, window_days, half_life_days) khi dataset là cửa sổ
+    thời gian của orders; khai thác tăng dần bằng SlidingWindowMiner.
+    """
+    key = result_cache.make_key(dataset, profits, minutil=minutil, mincor=mincor, maxlen=maxlen,
+                                top_k=top_k_patterns, targets=_target_key(target_items))
+    cohuis = result_cache.get(key)
+    if cohuis is None:
+        if target_items is not None:
+            cohuis = coium(dataset, minutil, mincor, maxlen, dataset_name="fashion_store", profits=profits,
+                           top_k=top_k_patterns, target_items=target_items)
+        elif window is not None and top_k_patterns is None:
+            cohuis = _mine_windowed(window, profits, minutil, mincor, maxlen)
+        elif window is None and orders_data is not None and top_k_patterns is None:
+            cohuis = _mine_incremental(orders_data, profits, minutil, mincor, maxlen)
+        else:
+            cohuis = coium(dataset, minutil, mincor, maxlen, dataset_name="fashion_store", profits=profits,
+                           top_k=top_k_patterns)
+        result_cache.put(key, cohuis)
+    return cohuis
+
+
+def recommendation_index(dataset, profits, minutil, mincor, maxlen, top_k_patterns=None, orders_data=None,
+                         superset_maxlen=None, target_items=None, window=None):
+    """
+    Chỉ mục láng giềng (NeighborIndex) của kết quả khai thác, lưu cùng khóa
+    với kết quả trong result_cache nên worker đã ấm không duyệt lại pattern.
+    Với superset_maxlen > maxlen (không top-k), kết quả được lọc từ lần khai
+    thác ở superset_maxlen: CoHUI không phụ thuộc maxlen nên tập CoHUI dài tối
+    đa maxlen đúng bằng phần tương ứng của tập khai thác ở maxlen lớn hơn.
+    """
+    key = result_cache.make_key(dataset, profits, minutil=minutil, mincor=mincor, maxlen=maxlen,
+                                top_k=top_k_patterns, targets=_target_key(target_items))
+    index = result_cache.get_index(key)
+    if index is None:
+        if target_items is not None:
+            cohuis = mine_cohuis(dataset, profits, minutil, mincor, maxlen, top_k_patterns,
+                                 target_items=target_items)
+        elif superset_maxlen is not None and superset_maxlen > maxlen and top_k_patterns is None:
+            cohuis = [entry for entry in mine_cohuis(dataset, profits, minutil, mincor, superset_maxlen,
+                                                     orders_data=orders_data, window=window)
+                      if len(entry[0]) <= maxlen]
+            result_cache.put(key, cohuis)
+        else:
+            cohuis = mine_cohuis(dataset, profits, minutil, mincor, maxlen, top_k_patterns, orders_data,
+                                 window=window)
+        index = NeighborIndex.build(cohuis)
+        result_cache.put_index(key, index)
+    return index
+
+
+def _overlap_start(previous, transactions):
+    """
+    Số k nhỏ nhất (tối đa nửa previous) sao cho previous[k:] là phần đầu của
+    transactions: k đơn hàng cũ nhất đã rơi khỏi danh sách (limit), phần còn
+    lại giữ nguyên thứ tự và đơn hàng mới nối vào cuối. None nếu không có.
+    """
+    n = len(previous)
+    if n == 0:
+        return 0
+    if not transactions:
+        return None
+    # Loại quá nửa số đơn cũ thì dựng lại miner cũng không chậm hơn
+    for k in range(n // 2 + 1):
+        if n - k <= len(transactions) and previous[k] == transactions[0] \
+                and previous[k:] == transactions[:n - k]:
+            return k
+    return None
 
 
-def get_product_recommendations(orders_data, target_products=None, minutil=0.001, mincor=0.3, maxlen=3, top_n=10):
+def _mine_incremental(orders_data, profits, minutil, mincor, maxlen):
+    """
+    Khai thác bằng IncrementalCoIUM, tái sử dụng miner cùng tham số nếu orders
+    là orders lần trước bỏ bớt các đơn cũ nhất ở đầu và thêm đơn mới ở cuối
+    (danh sách N đơn hàng gần nhất, cũ trước mới sau): đơn rơi khỏi danh sách
+    được evict, chỉ đơn mới được thêm. Mỗi đơn hàng là một transaction (không
+    gộp đơn giống nhau) để evict loại đúng các đơn cũ nhất.
+    """
+    params = (minutil, mincor, maxlen)
+    transactions = as_order_table(orders_data).transactions
+    state = _incremental_miners.pop(params, None)
+    n_expired = _overlap_start(state[0], transactions) if state is not None else None
+    if n_expired is not None and any(state[1].profits.get(product_id, price) != price
+                                     for product_id, price in profits.items()):
+        # Giá (lần đầu gặp) của sản phẩm đã thay đổi: utility cũ không còn đúng
+        n_expired = None
+    if n_expired is None:
+        applied = []
+        miner = IncrementalCoIUM(minutil, mincor, maxlen, dataset_name="fashion_store", profits={})
+        n_expired = 0
+    else:
+        applied, miner = state
+
+    # Giá của sản phẩm mới lấy từ đơn hàng (giống prepare_dataset_from_orders trên toàn bộ orders)
+    for product_id, price in profits.items():
+        miner.profits.setdefault(product_id, price)
+    expired = applied[:n_expired]
+    if expired:
+        del applied[:n_expired]
+        miner.evict(expired)
+    added = transactions[len(applied):]
+    if added:
+        miner.add_transactions(added)
+        applied.extend(added)
+
+    if len(_incremental_miners) >= _INCREMENTAL_MINERS_SIZE:
+        _incremental_miners.pop(next(iter(_incremental_miners)))
+    _incremental_miners[params] = (applied, miner)
+    return miner.mine()
+
+
+def _mine_windowed(window, profits, minutil, mincor, maxlen):
+    """Khai thác cửa sổ thời gian bằng SlidingWindowMiner cùng tham số, dựng miner mới nếu cửa sổ không trượt tiếp được"""
+    rows, now, window_days, half_life_days = window
+    params = (minutil, mincor, maxlen, window_days, half_life_days)
+    miner = _window_miners.pop(params, None)
+    if miner is not None:
+        # Giá của sản phẩm mới lấy từ đơn hàng (giống prepare_dataset_from_orders trên toàn bộ orders)
+        for product_id, price in profits.items():
+            miner.profits.setdefault(product_id, price)
+    if miner is None or not miner.advance(rows, now):
+        miner = SlidingWindowMiner(minutil, mincor, maxlen, profits, window_days, half_life_days,
+                                   dataset_name="fashion_store")
+        miner.advance(rows, now)
+
+    if len(_window_miners) >= _INCREMENTAL_MINERS_SIZE:
+        _window_miners.pop(next(iter(_window_miners)))
+    _window_miners[params] = miner
+    return miner.mine(now)
+
+
+def get_product_recommendations(orders_data, target_products=None, minutil=0.001, mincor=0.3, maxlen=3, top_n=10,
+                                top_k_patterns=None, superset_maxlen=None, constrain_to_targets=False,
+                                window_days=None, half_life_days=None, now=None):
     """
     Lấy danh sách sản phẩm gợi ý dựa trên CoHUI
     
@@ -73,74 +229,72 @@ def get_product_recommendations(orders_data, target_products=None, minutil=0.001
         mincor: Minimum correlation threshold
         maxlen: Độ dài tối đa của itemset
         top_n: Số lượng gợi ý trả về
+        top_k_patterns: Nếu có, chỉ khai thác k pattern có utility cao nhất
+            (top-k, ngưỡng tự nâng dần; minutil chỉ còn là ngưỡng sàn)
+        superset_maxlen: Nếu lớn hơn maxlen (và không dùng top-k), khai thác ở
+            superset_maxlen rồi lọc itemset dài tối đa maxlen; nhiều truy vấn
+            cùng minutil/mincor nhờ đó chia sẻ một lần khai thác (action batch)
+        constrain_to_targets: Nếu True (và có target_products), chỉ khai thác
+            pattern chứa ít nhất một sản phẩm đích, trên các đơn hàng chứa
+            chúng (nhanh hơn). Gợi ý, score và frequency không đổi, nhưng
+            totalPatterns, patterns và confidence khi đó tính trên các
+            pattern chứa sản phẩm đích nên chỉ bật khi phía gọi yêu cầu
+            (constrainToTargets)
+        window_days: Nếu có, chỉ dùng đơn hàng trong window_days ngày tính tới now
+        half_life_days: Nếu có, mỗi đơn hàng có trọng số 2^(-tuổi / half_life_days)
+            trong utility và support
+        now: Thời điểm tính cửa sổ / suy giảm (ISO 8601 hoặc mili giây, mặc
+            định là thời điểm của đơn hàng mới nhất); hai tham số trên cần
+            orderDate của mọi đơn hàng
     
     Returns:
         List of recommended product IDs với điểm số
     """
     try:
-        # Chuẩn bị dataset
-        dataset, profits = prepare_dataset_from_orders(orders_data)
+        # Chuẩn bị dataset (một lượt duyệt orders, bỏ qua nếu đã là OrderTable)
+        orders_data = as_order_table(orders_data)
+        window = None
+        if window_days or half_life_days:
+            # Cửa sổ thời gian: không gộp đơn hàng giống nhau để đơn hết hạn được evict theo thứ tự thời gian
+            rows, now = window_rows(orders_data.timestamps, orders_data.transactions, window_days,
+                                    parse_timestamp(now))
+            dataset, profits = decayed_dataset(rows, half_life_days, now), orders_data.profits
+            window = (rows, now, window_days, half_life_days)
+            n_orders = len(rows)
+        else:
+            dataset, profits = prepare_compact_dataset(orders_data)
+            n_orders = dataset.n_transactions
         
-        if not dataset or len(dataset) < 2:
+        if not dataset or n_orders < 2:
             return {
                 "success": False,
                 "message": "Không đủ dữ liệu đơn hàng để phân tích",
                 "recommendations": []
             }
         
-        # Chạy thuật toán CoHUI (truyền profits từ dataset)
-        cohuis = coium(dataset, minutil, mincor, maxlen, dataset_name="fashion_store", profits=profits)
+        # Chỉ mục láng giềng của kết quả CoHUI (khai thác hoặc lấy từ cache nếu đã có)
+        target_items = target_products if constrain_to_targets and target_products else None
+        index = recommendation_index(dataset, profits, minutil, mincor, maxlen, top_k_patterns, orders_data,
+                                     superset_maxlen, target_items, window)
         
-        if not cohuis:
+        if not index.n_patterns:
             return {
                 "success": True,
                 "message": "Không tìm thấy pattern phù hợp, giảm mincor hoặc minutil",
                 "recommendations": []
             }
         
-        # Sắp xếp theo utility giảm dần
-        cohuis.sort(key=lambda x: x[1], reverse=True)
-        
-        # Tính điểm cho mỗi sản phẩm
-        product_scores = defaultdict(float)
-        product_count = defaultdict(int)
-        
-        for itemset, utility, correlation in cohuis:
-            # Trọng số kết hợp utility và correlation
-            score = utility * correlation
-            
-            for product_id in itemset:
-                # Nếu user đang xem một sản phẩm, gợi ý các sản phẩm khác trong pattern
-                if target_products:
-                    if any(target in itemset for target in target_products) and product_id not in target_products:
-                        product_scores[product_id] += score * 1.5  # Boost cho related products
-                        product_count[product_id] += 1
-                else:
-                    # Gợi ý tất cả sản phẩm trong pattern
-                    product_scores[product_id] += score
-                    product_count[product_id] += 1
-        
-        # Chuẩn hóa điểm số và tạo danh sách gợi ý
-        recommendations = []
-        for product_id, total_score in product_scores.items():
-            avg_score = total_score / product_count[product_id]
-            recommendations.append({
-                "productID": product_id,
-                "score": round(avg_score, 2),
-                "frequency": product_count[product_id],
-                "confidence": round(min(product_count[product_id] / len(cohuis) * 100, 100), 2)
-            })
-        
-        # Sắp xếp theo điểm số
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Lấy top N
-        top_recommendations = recommendations[:top_n]
+        # Tra chỉ mục: gợi ý chung / theo sản phẩm đích, đã xếp hạng sẵn
+        ranking, n_recommended = index.recommend(target_products, top_n)
+        top_recommendations = [
+            {"productID": product_id, "score": score, "frequency": frequency, "confidence": confidence}
+            for product_id, score, frequency, confidence in ranking
+        ]
         
         return {
             "success": True,
-            "message": f"Tìm thấy {len(cohuis)} patterns, {len(recommendations)} sản phẩm gợi ý",
-            "totalPatterns": len(cohuis),
+            "message": f"Tìm thấy {index.n_patterns} patterns, {n_recommended} sản phẩm gợi ý",
+            "totalPatterns": index.n_patterns,
             "recommendations": top_recommendations,
             "patterns": [
                 {
@@ -148,7 +302,7 @@ def get_product_recommendations(orders_data, target_products=None, minutil=0.001
                     "utility": round(utility, 2),
                     "correlation": round(correlation, 4)
                 }
-                for itemset, utility, correlation in cohuis[:5]  # Top 5 patterns
+                for itemset, utility, correlation in index.patterns[:5]  # Top 5 patterns
             ]
         }
         
@@ -165,7 +319,8 @@ def get_product_recommendations(orders_data, target_products=None, minutil=0.001
         }
 
 
-def get_frequent_bought_together(orders_data, product_id, minutil=0.001, mincor=0.3, top_n=5):
+def get_frequent_bought_together(orders_data, product_id, minutil=0.001, mincor=0.3, top_n=5, window_days=None,
+                                 half_life_days=None, now=None, constrain_to_targets=False):
     """
     Tìm các sản phẩm thường được mua cùng với product_id
     
@@ -175,6 +330,8 @@ def get_frequent_bought_together(orders_data, product_id, minutil=0.001, mincor=
         minutil: Minimum utility threshold
         mincor: Minimum correlation threshold
         top_n: Số lượng gợi ý
+        window_days, half_life_days, now: Cửa sổ thời gian (xem get_product_recommendations)
+        constrain_to_targets: Chỉ khai thác pattern chứa product_id (xem get_product_recommendations)
     
     Returns:
         List sản phẩm thường mua cùng
@@ -185,13 +342,18 @@ def get_frequent_bought_together(orders_data, product_id, minutil=0.001, mincor=
         minutil=minutil,
         mincor=mincor,
         maxlen=3,
-        top_n=top_n
+        top_n=top_n,
+        constrain_to_targets=constrain_to_targets,
+        window_days=window_days,
+        half_life_days=half_life_days,
+        now=now
     )
     
     return result
 
 
-def analyze_shopping_cart(orders_data, cart_items, minutil=0.001, mincor=0.3, top_n=5):
+def analyze_shopping_cart(orders_data, cart_items, minutil=0.001, mincor=0.3, top_n=5, window_days=None,
+                          half_life_days=None, now=None, constrain_to_targets=False):
     """
     Phân tích giỏ hàng và gợi ý sản phẩm bổ sung
     
@@ -201,6 +363,8 @@ def analyze_shopping_cart(orders_data, cart_items, minutil=0.001, mincor=0.3, to
         minutil: Minimum utility threshold
         mincor: Minimum correlation threshold
         top_n: Số lượng gợi ý
+        window_days, half_life_days, now: Cửa sổ thời gian (xem get_product_recommendations)
+        constrain_to_targets: Chỉ khai thác pattern chứa sản phẩm trong giỏ (xem get_product_recommendations)
     
     Returns:
         List sản phẩm nên thêm vào giỏ
@@ -211,12 +375,224 @@ def analyze_shopping_cart(orders_data, cart_items, minutil=0.001, mincor=0.3, to
         minutil=minutil,
         mincor=mincor,
         maxlen=len(cart_items) + 2,
-        top_n=top_n
+        top_n=top_n,
+        constrain_to_targets=constrain_to_targets,
+        window_days=window_days,
+        half_life_days=half_life_days,
+        now=now
     )
     
     return result
 
 
+def _window_parameters(query):
+    """Tham số cửa sổ thời gian của một request (windowDays, decayHalfLifeDays, now)"""
+    return {
+        "window_days": query.get('windowDays', None),
+        "half_life_days": query.get('decayHalfLifeDays', None),
+        "now": query.get('now', None),
+    }
+
+
+def _query_parameters(query):
+    """
+    Tham số get_product_recommendations của một truy vấn recommend /
+    bought_together / cart_analysis (cùng giá trị mặc định với từng action);
+    None nếu action không hợp lệ.
+    """
+    action = query.get('action', 'recommend')
+    params = {
+        "minutil": query.get('minutil', 0.001),
+        "mincor": query.get('mincor', 0.3),
+        **_window_parameters(query),
+    }
+    if action == 'recommend':
+        params.update(target_products=query.get('targetProducts', None), maxlen=query.get('maxlen', 3),
+                      top_n=query.get('topN', 10), top_k_patterns=query.get('topKPatterns', None))
+    elif action == 'bought_together':
+        params.update(target_products=[query.get('productID')], maxlen=3, top_n=query.get('topN', 5),
+                      constrain_to_targets=query.get('constrainToTargets', False))
+    elif action == 'cart_analysis':
+        cart_items = query.get('cartItems', [])
+        params.update(target_products=cart_items, maxlen=len(cart_items) + 2, top_n=query.get('topN', 5),
+                      constrain_to_targets=query.get('constrainToTargets', False))
+    else:
+        return None
+    return params
+
+
+def _batch_group(params):
+    """Các truy vấn cùng nhóm chỉ khác nhau ở maxlen / sản phẩm đích / top_n"""
+    return (params['minutil'], params['mincor'], params['window_days'], params['half_life_days'], params['now'])
+
+
+def run_batch(orders_data, queries):
+    """
+    Trả lời nhiều truy vấn trên cùng một orders: các truy vấn cùng
+    (minutil, mincor, cửa sổ thời gian) dùng chung một lần khai thác ở maxlen lớn nhất của nhóm
+    (truy vấn top-k khai thác riêng theo tham số của nó; truy vấn có
+    constrainToTargets khai thác ràng buộc theo sản phẩm đích), mỗi truy vấn sau
+    đó chỉ còn là tra chỉ mục láng giềng.
+    """
+    orders_data = as_order_table(orders_data)
+    parameters = [_query_parameters(query) for query in queries]
+    group_maxlen = {}
+    for params in parameters:
+        if params is not None and params.get('top_k_patterns') is None and not params.get('constrain_to_targets'):
+            group = _batch_group(params)
+            group_maxlen[group] = max(group_maxlen.get(group, 0), params['maxlen'])
+
+    results = []
+    for query, params in zip(queries, parameters):
+        if params is None:
+            result = {
+                "success": False,
+                "message": f"Action không hợp lệ: {query.get('action')}"
+            }
+        else:
+            superset_maxlen = group_maxlen.get(_batch_group(params))
+            result = get_product_recommendations(orders_data, superset_maxlen=superset_maxlen, **params)
+        if 'id' in query:
+            result = dict(result, id=query['id'])
+        results.append(result)
+
+    return {
+        "success": True,
+        "totalQueries": len(results),
+        "results": results
+    }
+
+
+def handle_request(input_data):
+    """
+    Xử lý một request (dict đã parse từ JSON) và trả về dict kết quả.
+    orders có thể là list đơn hàng, payload dạng cột hoặc OrderTable (read_request).
+    """
+    action = input_data.get('action', 'recommend')
+    orders_data = input_data.get('orders', [])
+    if action in ('recommend', 'bought_together', 'cart_analysis', 'batch'):
+        orders_data = as_order_table(orders_data)
+
+    if action == 'recommend':
+        # Gợi ý sản phẩm chung
+        target_products = input_data.get('targetProducts', None)
+        minutil = input_data.get('minutil', 0.001)
+        mincor = input_data.get('mincor', 0.3)
+        maxlen = input_data.get('maxlen', 3)
+        top_n = input_data.get('topN', 10)
+        top_k_patterns = input_data.get('topKPatterns', None)
+
+        return get_product_recommendations(
+            orders_data,
+            target_products,
+            minutil,
+            mincor,
+            maxlen,
+            top_n,
+            top_k_patterns,
+            **_window_parameters(input_data)
+        )
+
+    if action == 'bought_together':
+        # Sản phẩm mua cùng
+        product_id = input_data.get('productID')
+        minutil = input_data.get('minutil', 0.001)
+        mincor = input_data.get('mincor', 0.3)
+        top_n = input_data.get('topN', 5)
+
+        return get_frequent_bought_together(
+            orders_data,
+            product_id,
+            minutil,
+            mincor,
+            top_n,
+            constrain_to_targets=input_data.get('constrainToTargets', False),
+            **_window_parameters(input_data)
+        )
+
+    if action == 'cart_analysis':
+        # Phân tích giỏ hàng
+        cart_items = input_data.get('cartItems', [])
+        minutil = input_data.get('minutil', 0.001)
+        mincor = input_data.get('mincor', 0.3)
+        top_n = input_data.get('topN', 5)
+
+        return analyze_shopping_cart(
+            orders_data,
+            cart_items,
+            minutil,
+            mincor,
+            top_n,
+            constrain_to_targets=input_data.get('constrainToTargets', False),
+            **_window_parameters(input_data)
+        )
+
+    if action == 'batch':
+        # Nhiều truy vấn recommend/bought_together/cart_analysis, khai thác một lần
+        return run_batch(orders_data, input_data.get('queries', []))
+
+    if action == 'cache_stats':
+        # Bộ đếm hit/miss của cache kết quả (hữu ích với worker chạy lâu dài)
+        return {"success": True, "cache": result_cache.stats()}
+
+    return {
+        "success": False,
+        "message": f"Action không hợp lệ: {action}"
+    }
+
+
+# Trường "id" là khóa đầu tiên của object request (Node.js gửi id trước)
+LEADING_ID_PATTERN = re.compile(r'\s*\{\s*"id"\s*:\s*(-?\d+|"(?:[^"\\]|\\.)*")')
+
+
+def _leading_request_id(line):
+    """Trường "id" của một dòng request không parse được (JSON hỏng), nếu nó đứng đầu object"""
+    match = LEADING_ID_PATTERN.match(line)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+def run_worker(input_stream, output_stream):
+    """
+    Chế độ worker chạy lâu dài (--worker): mỗi dòng trên input_stream là một
+    request JSON, mỗi response được ghi thành đúng một dòng JSON trên
+    output_stream. Nếu request có trường "id", response trả lại cùng "id" để
+    phía gọi ghép cặp. Thư viện, profits và dataset đã chuẩn bị được giữ ấm
+    giữa các request. Mọi print() khác trong lúc xử lý được chuyển sang stderr
+    để không làm hỏng giao thức.
+    """
+    for line in input_stream:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            # Đơn hàng được nạp thẳng vào OrderTable, không giữ list dict đơn hàng
+            input_data = parse_request(line)
+            request_id = input_data.get('id')
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                result = handle_request(input_data)
+            finally:
+                sys.stdout = stdout
+        except Exception as e:
+            if request_id is None:
+                request_id = e.request_id if isinstance(e, RequestError) else _leading_request_id(line)
+            result = {
+                "success": False,
+                "message": f"Lỗi: {str(e)}",
+                "recommendations": []
+            }
+        if request_id is not None:
+            result = dict(result, id=request_id)
+        output_stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output_stream.flush()
+
+
 if __name__ == "__main__":
     # Đọc input từ stdin (được gọi từ Node.js)
     try:
@@ -224,67 +600,21 @@ if __name__ == "__main__":
         if sys.platform == 'win32':
             import io
             sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+        if '--worker' in sys.argv[1:]:
+            # Worker chạy lâu dài: NDJSON request/response qua stdin/stdout
+            if sys.platform == 'win32':
+                sys.stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            run_worker(sys.stdin, sys.stdout)
+            sys.exit(0)
         
-        # Đọc từ stdin thay vì sys.argv (tránh ENAMETOOLONG với data lớn)
-        input_json = sys.stdin.read()
+        # Đọc từ stdin thay vì sys.argv (tránh ENAMETOOLONG với data lớn).
+        # Parse theo từng chunk: mảng orders được nạp từng đơn hàng vào OrderTable
+        # thay vì giữ cả chuỗi input lẫn list dict đơn hàng trong bộ nhớ
+        input_data = read_request(sys.stdin)
         
-        if input_json and input_json.strip():
-            input_data = json.loads(input_json)
-            
-            action = input_data.get('action', 'recommend')
-            orders_data = input_data.get('orders', [])
-            
-            if action == 'recommend':
-                # Gợi ý sản phẩm chung
-                target_products = input_data.get('targetProducts', None)
-                minutil = input_data.get('minutil', 0.001)
-                mincor = input_data.get('mincor', 0.3)
-                maxlen = input_data.get('maxlen', 3)
-                top_n = input_data.get('topN', 10)
-                
-                result = get_product_recommendations(
-                    orders_data, 
-                    target_products,
-                    minutil, 
-                    mincor, 
-                    maxlen, 
-                    top_n
-                )
-                
-            elif action == 'bought_together':
-                # Sản phẩm mua cùng
-                product_id = input_data.get('productID')
-                minutil = input_data.get('minutil', 0.001)
-                mincor = input_data.get('mincor', 0.3)
-                top_n = input_data.get('topN', 5)
-                
-                result = get_frequent_bought_together(
-                    orders_data,
-                    product_id,
-                    minutil,
-                    mincor,
-                    top_n
-                )
-                
-            elif action == 'cart_analysis':
-                # Phân tích giỏ hàng
-                cart_items = input_data.get('cartItems', [])
-                minutil = input_data.get('minutil', 0.001)
-                mincor = input_data.get('mincor', 0.3)
-                top_n = input_data.get('topN', 5)
-                
-                result = analyze_shopping_cart(
-                    orders_data,
-                    cart_items,
-                    minutil,
-                    mincor,
-                    top_n
-                )
-            else:
-                result = {
-                    "success": False,
-                    "message": f"Action không hợp lệ: {action}"
-                }
+        if input_data is not None:
+            result = handle_request(input_data)
             
             # Trả về kết quả dạng JSON
             print(json.dumps(result, ensure_ascii=False))
@@ -0,0 +1,214 @@
+"""
+Cache kết quả khai thác (cohuis) hai tầng:
+- Tầng 1: LRU trong tiến trình (OrderedDict)
+- Tầng 2: file JSON trên đĩa, dùng chung giữa các lần chạy / tiến trình,
+  giữ tối đa max_disk_entries khóa (khóa dùng lâu nhất theo mtime bị xóa khi ghi)
+Khóa là SHA-256 của nội dung dataset đã chuẩn bị (transaction + trọng số),
+profits và các tham số khai thác. Cùng khóa có thể lưu kèm chỉ mục láng giềng
+(neighbor_index.NeighborIndex) xây từ kết quả đó.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from data_utils import transaction_weights
+from neighbor_index import NeighborIndex
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'results')
+RESULT_CACHE_VERSION = 1
+# Số khóa tối đa giữ trên đĩa (mỗi order set khác nhau sinh một khóa mới)
+DEFAULT_MAX_DISK_ENTRIES = 256
+
+
+def dataset_fingerprint(dataset, profits):
+    """SHA-256 của nội dung dataset (kể cả trọng số nếu có) và profits"""
+    digest = hashlib.sha256()
+    weights = transaction_weights(dataset)
+    for tid, trans in enumerate(dataset):
+        digest.update(json.dumps(list(trans)).encode())
+        if weights is not None:
+            # repr: trọng số thực (vd. suy giảm theo thời gian) không bị cắt phần lẻ
+            digest.update(b'*' + repr(weights[tid]).encode())
+        digest.update(b'\n')
+    digest.update(json.dumps(sorted((str(item), float(p)) for item, p in profits.items())).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU trong bộ nhớ (tối đa maxsize kết quả) phía trước một thư mục trên đĩa
+    (directory=None: chỉ dùng bộ nhớ). get() trả về bản sao list kết quả nên
+    phía gọi có thể sắp xếp/sửa tự do. Thư mục giữ tối đa max_disk_entries
+    khóa (kết quả + chỉ mục): mỗi lần đọc trúng trên đĩa cập nhật mtime, mỗi lần ghi
+    xóa các khóa có mtime cũ nhất vượt quá giới hạn (None: không giới hạn).
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxsize=32, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._indexes = OrderedDict()
+        self._fingerprints = {}
+
+    def make_key(self, dataset, profits, **params):
+        """Khóa cache của (dataset, profits, tham số khai thác)"""
+        cached = self._fingerprints.get(id(dataset))
+        if cached is not None and cached[0] is dataset and cached[1] == len(dataset) and cached[2] == profits:
+            fingerprint = cached[3]
+        else:
+            fingerprint = dataset_fingerprint(dataset, profits)
+            # Giữ tham chiếu tới dataset để id() không bị tái sử dụng; chỉ nhớ dataset gần nhất
+            self._fingerprints = {id(dataset): (dataset, len(dataset), dict(profits), fingerprint)}
+        payload = json.dumps([RESULT_CACHE_VERSION, fingerprint, sorted(params.items())], default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Kết quả đã cache của key, hoặc None nếu chưa có"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return list(self._entries[key])
+
+        cohuis = self._load(key)
+        if cohuis is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, cohuis)
+        return list(cohuis)
+
+    def put(self, key, cohuis):
+        cohuis = [(list(itemset), utility, correlation) for itemset, utility, correlation in cohuis]
+        self._remember(key, cohuis)
+        self._save(key, cohuis)
+
+    def get_index(self, key):
+        """Chỉ mục láng giềng đã lưu cho key (bộ nhớ rồi đĩa), hoặc None"""
+        if key in self._indexes:
+            self._indexes.move_to_end(key)
+            return self._indexes[key]
+        data = self._load(key, suffix='.index')
+        if data is None:
+            return None
+        try:
+            index = NeighborIndex.from_dict(data)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Warning: bỏ qua chỉ mục hỏng {key}: {e}", file=sys.stderr)
+            return None
+        self._remember_index(key, index)
+        return index
+
+    def put_index(self, key, index):
+        self._remember_index(key, index)
+        self._save(key, index.to_dict(), suffix='.index')
+
+    def clear(self, disk=False):
+        self._entries.clear()
+        self._indexes.clear()
+        if disk and self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "indexes": len(self._indexes),
+        }
+
+    def _remember(self, key, cohuis):
+        self._entries[key] = cohuis
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _remember_index(self, key, index):
+        self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > self.maxsize:
+            self._indexes.popitem(last=False)
+
+    def _path(self, key, suffix=''):
+        return os.path.join(self.directory, f"{key}{suffix}.json")
+
+    def _load(self, key, suffix=''):
+        if not self.directory:
+            return None
+        path = self._path(key, suffix)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            data = data if suffix else [tuple(entry) for entry in data]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Warning: bỏ qua cache hỏng {key}: {e}", file=sys.stderr)
+            return None
+        try:
+            # Đánh dấu vừa dùng để _prune giữ lại (LRU theo mtime)
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _save(self, key, data, suffix=''):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self._path(key, suffix)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, default=_json_number)
+            os.replace(tmp_path, self._path(key, suffix))
+        except OSError as e:
+            print(f"Warning: không ghi được cache {key}: {e}", file=sys.stderr)
+            return
+        self._prune()
+
+    def _prune(self):
+        """Xóa các khóa (kết quả + chỉ mục) dùng lâu nhất khi thư mục vượt max_disk_entries khóa"""
+        if self.max_disk_entries is None:
+            return
+        last_used = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    key = entry.name.split('.', 1)[0]
+                    last_used[key] = max(last_used.get(key, mtime), mtime)
+        except OSError:
+            return
+        if len(last_used) <= self.max_disk_entries:
+            return
+        expired = sorted(last_used, key=last_used.get)[:len(last_used) - self.max_disk_entries]
+        for key in expired:
+            for suffix in ('', '.index'):
+                try:
+                    os.remove(self._path(key, suffix))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Warning: không xóa được cache {key}: {e}", file=sys.stderr)
+
+
+def _json_number(value):
+    """Chuyển số NumPy (utility từ profits sinh ngẫu nhiên) sang số Python khi ghi JSON"""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Không serialize được {type(value).__name__}")
@@ -0,0 +1,305 @@
+"""
+Tìm kiếm depth-first theo lớp tương đương prefix (dùng chung cho CoIUM và CoUPM)
+- Mỗi lớp tương đương gồm các itemset prefix + [item] cùng Utility-List của chúng
+- Cắt tỉa bằng cận u + r, EUCS và correlation; không còn giới hạn số tổ hợp ẩn
+"""
+
+import heapq
+import multiprocessing
+import sys
+import time
+from structures import join_utility_lists_batch
+from parallel import resolve_workers, run_prefix_tasks
+from heuristics import eucs_pruning, utility_upper_bound_pruning
+from metrics import calculate_kulc_pair
+
+
+class MiningBudget:
+    """
+    Ngân sách công việc tường minh cho tìm kiếm:
+    - max_joins: số lần join Utility-List tối đa (None = không giới hạn)
+    - max_seconds: thời gian tìm kiếm tối đa tính từ start() (None = không giới hạn)
+    Khi hết ngân sách, tìm kiếm dừng sớm và exhausted = True, nghĩa là tập
+    kết quả trả về KHÔNG đầy đủ. Khi chạy song song, deadline là chung và số
+    join được đếm trên một bộ đếm dùng chung giữa các tiến trình.
+    """
+    __slots__ = ('max_joins', 'max_seconds', 'joins', 'exhausted', '_deadline', '_shared_joins')
+
+    def __init__(self, max_joins=None, max_seconds=None):
+        self.max_joins = max_joins
+        self.max_seconds = max_seconds
+        self.joins = 0
+        self.exhausted = False
+        self._deadline = None
+        self._shared_joins = None
+
+    def __getstate__(self):
+        # Bộ đếm dùng chung chỉ được truyền qua initargs lúc tạo tiến trình
+        return (self.max_joins, self.max_seconds, self.joins, self.exhausted, self._deadline)
+
+    def __setstate__(self, state):
+        self.max_joins, self.max_seconds, self.joins, self.exhausted, self._deadline = state
+        self._shared_joins = None
+
+    def share(self, counter):
+        """Gắn bộ đếm join dùng chung (multiprocessing.Value('q'))"""
+        self._shared_joins = counter
+
+    def start(self):
+        self.joins = 0
+        self.exhausted = False
+        self._deadline = time.monotonic() + self.max_seconds if self.max_seconds is not None else None
+        return self
+
+    def allow(self, n_joins):
+        """Xin phép thực hiện n_joins lần join; trả về số join được phép (0..n_joins)"""
+        if self.exhausted:
+            return 0
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self.exhausted = True
+            return 0
+        allowed = n_joins
+        if self.max_joins is not None:
+            if self._shared_joins is not None:
+                with self._shared_joins.get_lock():
+                    allowed = max(0, min(n_joins, self.max_joins - self._shared_joins.value))
+                    self._shared_joins.value += allowed
+            else:
+                allowed = min(n_joins, self.max_joins - self.joins)
+            if allowed < n_joins:
+                self.exhausted = True
+        self.joins += allowed
+        return allowed
+
+    def report(self):
+        return {
+            "joins": self.joins,
+            "max_joins": self.max_joins,
+            "max_seconds": self.max_seconds,
+            "exhausted": self.exhausted,
+        }
+
+
+class TopKCollector:
+    """
+    Giữ k CoHUI có utility cao nhất bằng min-heap. Khi heap đầy, ngưỡng
+    utility nội bộ được nâng lên bằng utility nhỏ nhất trong heap, nên các
+    nhánh có cận trên thấp hơn bị cắt sớm hơn so với ngưỡng cố định.
+    Khi bằng utility, itemset tìm thấy trước được giữ lại.
+    """
+    __slots__ = ('k', 'threshold', '_heap', '_seq')
+
+    def __init__(self, k, minutil_abs=0):
+        if k <= 0:
+            raise ValueError("top_k phải > 0")
+        self.k = k
+        self.threshold = minutil_abs
+        self._heap = []
+        self._seq = 0
+
+    def append(self, entry):
+        utility = entry[1]
+        if utility < self.threshold:
+            return
+        self._seq += 1
+        node = (utility, -self._seq, entry)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, node)
+        else:
+            heapq.heappushpop(self._heap, node)
+        if len(self._heap) >= self.k:
+            self.threshold = max(self.threshold, self._heap[0][0])
+
+    def __len__(self):
+        return len(self._heap)
+
+    def results(self):
+        """Danh sách (itemset, utility, correlation) giảm dần theo utility"""
+        return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+
+def topk_initial_threshold(item_utilities, k):
+    """
+    Ngưỡng khởi đầu cho top-k: utility lớn thứ k của các item đơn. Mọi item
+    đơn có correlation 1.0 nên k item này luôn là ứng viên hợp lệ.
+    """
+    if k is None or len(item_utilities) < k:
+        return 0
+    return heapq.nlargest(k, item_utilities)[-1]
+
+
+def search_equivalence_class(prefix, prefix_ul, extensions, supports, minutil_abs, mincor, maxlen,
+                             cohuis, twu_table=None, budget=None):
+    """
+    Duyệt depth-first một lớp tương đương prefix.
+    extensions: list (item, UL(prefix + [item]), correlation(prefix + [item])) theo thứ tự xử lý.
+    - Kulc (min theo cặp) là anti-monotone: itemset không đạt mincor thì mọi
+      superset cũng không đạt, nên cắt cả nhánh trước khi join.
+    - Chỉ mở rộng itemset có u + r >= minutil_abs (cận trên của mọi superset).
+    - EUCS loại phần mở rộng có cặp (item, item_y) với TWU < minutil_abs.
+    cohuis là list kết quả hoặc TopKCollector (khi đó ngưỡng lấy từ collector).
+    """
+    for i in range(len(extensions)):
+        _expand_extension(prefix, prefix_ul, extensions, i, supports, minutil_abs, mincor, maxlen,
+                          cohuis, twu_table, budget)
+
+
+def _expand_extension(prefix, prefix_ul, extensions, i, supports, minutil_abs, mincor, maxlen,
+                      cohuis, twu_table, budget):
+    """Ghi nhận itemset prefix + [extensions[i]] rồi duyệt cây con của nó"""
+    item, ul, correlation = extensions[i]
+    if isinstance(cohuis, TopKCollector):
+        minutil_abs = cohuis.threshold
+    itemset = prefix + [item]
+    utility = ul.get_total_utility()
+    if utility >= minutil_abs:
+        cohuis.append((itemset, utility, correlation))
+
+    if len(itemset) >= maxlen or not utility_upper_bound_pruning(ul, minutil_abs):
+        return
+    # Hết ngân sách: vẫn ghi nhận các itemset đã có UL nhưng không join thêm
+    if budget is not None and budget.exhausted:
+        return
+
+    candidates = []
+    for item_y, ul_y, _ in extensions[i + 1:]:
+        if twu_table is not None and not eucs_pruning(item, item_y, twu_table, minutil_abs):
+            continue
+        # Correlation của itemset + [item_y] tính tăng dần từ correlation của itemset
+        new_correlation = correlation
+        for x in itemset:
+            new_correlation = min(new_correlation, calculate_kulc_pair(x, item_y, supports))
+            if new_correlation < mincor:
+                break
+        if new_correlation >= mincor:
+            candidates.append((item_y, ul_y, new_correlation))
+
+    if budget is not None:
+        candidates = candidates[:budget.allow(len(candidates))]
+    joined = join_utility_lists_batch(ul, [ul_y for _, ul_y, _ in candidates], prefix_ul)
+    next_extensions = [(item_y, ul_xy, new_correlation)
+                       for (item_y, _, new_correlation), ul_xy in zip(candidates, joined) if ul_xy]
+    if next_extensions:
+        search_equivalence_class(itemset, ul, next_extensions, supports, minutil_abs, mincor, maxlen,
+                                 cohuis, twu_table, budget)
+
+
+# Trạng thái của mỗi tiến trình worker (gửi một lần qua initializer)
+_worker_state = None
+
+
+def _init_search_worker(extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget,
+                        shared_joins, top_k):
+    global _worker_state
+    if budget is not None and shared_joins is not None:
+        budget.share(shared_joins)
+    _worker_state = (extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget, top_k)
+
+
+def _mine_first_level(index):
+    """Task của worker: khai thác cây con của item cấp 1 thứ `index`"""
+    extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget, top_k = _worker_state
+    cohuis = TopKCollector(top_k, minutil_abs) if top_k is not None else []
+    joins_before = budget.joins if budget is not None else 0
+    _expand_extension([], None, extensions, index, supports, minutil_abs, mincor, maxlen,
+                      cohuis, twu_table, budget)
+    if budget is None:
+        return cohuis.results() if top_k is not None else cohuis, 0, False
+    return (cohuis.results() if top_k is not None else cohuis,
+            budget.joins - joins_before, budget.exhausted)
+
+
+def _mine_parallel(extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget, top_k, workers,
+                   n_first_level):
+    """Chia các cây con prefix cấp 1 cho `workers` tiến trình và gộp kết quả theo thứ tự item"""
+    shared_joins = None
+    if budget is not None and budget.max_joins is not None:
+        shared_joins = multiprocessing.Value('q', 0)
+    # Ước lượng kích thước cây con: |UL(item)| x số item đứng sau nó
+    weights = [len(ul) * (len(extensions) - i - 1) for i, (_, ul, _) in enumerate(extensions[:n_first_level])]
+    results = run_prefix_tasks(
+        _mine_first_level, list(range(n_first_level)), weights, workers,
+        initializer=_init_search_worker,
+        initargs=(extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget, shared_joins, top_k),
+    )
+
+    cohuis = TopKCollector(top_k, minutil_abs) if top_k is not None else []
+    for part, joins, exhausted in results:
+        if top_k is not None:
+            for entry in part:
+                cohuis.append(entry)
+        else:
+            cohuis.extend(part)
+        if budget is not None:
+            budget.joins += joins
+            budget.exhausted = budget.exhausted or exhausted
+    return cohuis
+
+
+def mine_prefix_subtrees(items, utility_lists, first_level, supports, minutil_abs, mincor, maxlen,
+                         twu_table=None, workers=None):
+    """
+    Khai thác riêng cây con của từng item cấp 1 trong first_level (tập con
+    của `items`, thứ tự xử lý là `items`). Trả về dict item -> list CoHUI có
+    item đầu tiên (theo thứ tự xử lý) là item đó; dùng cho khai thác tăng dần,
+    khi chỉ một phần các cây con cần tìm lại.
+    """
+    extensions = [(item, utility_lists[item], 1.0) for item in items]
+    positions = {item: i for i, item in enumerate(items)}
+    indices = [positions[item] for item in first_level]
+
+    workers = resolve_workers(workers)
+    if workers > 1 and len(indices) > 1:
+        weights = [len(extensions[i][1]) * (len(extensions) - i - 1) for i in indices]
+        parts = run_prefix_tasks(
+            _mine_first_level, indices, weights, workers,
+            initializer=_init_search_worker,
+            initargs=(extensions, supports, minutil_abs, mincor, maxlen, twu_table, None, None, None),
+        )
+        return {items[i]: part for i, (part, _, _) in zip(indices, parts)}
+
+    subtrees = {}
+    for i in indices:
+        cohuis = []
+        _expand_extension([], None, extensions, i, supports, minutil_abs, mincor, maxlen,
+                          cohuis, twu_table, None)
+        subtrees[items[i]] = cohuis
+    return subtrees
+
+
+def mine_equivalence_classes(items, utility_lists, supports, minutil_abs, mincor, maxlen,
+                             twu_table=None, budget=None, top_k=None, workers=None, n_first_level=None):
+    """
+    Khai thác đầy đủ mọi CoHUI từ các item đơn (theo thứ tự xử lý `items`).
+    Trả về list (itemset, utility, correlation). Nếu có budget, kiểm tra
+    budget.exhausted sau khi chạy để biết kết quả có bị cắt hay không.
+    Với top_k, chỉ trả về k itemset có utility cao nhất (giảm dần), minutil_abs
+    đóng vai trò ngưỡng sàn.
+    Với workers=N > 1, các cây con prefix cấp 1 được khai thác song song trên
+    N tiến trình; kết quả giống hệt khi chạy tuần tự (cùng thứ tự).
+    Với n_first_level, chỉ n_first_level item đầu của `items` làm prefix cấp 1
+    (các item còn lại chỉ xuất hiện như phần mở rộng): chỉ khai thác itemset
+    chứa ít nhất một trong các item đó.
+    """
+    if n_first_level is None:
+        n_first_level = len(items)
+    if budget is not None:
+        budget.start()
+    if top_k is not None:
+        minutil_abs = max(minutil_abs, topk_initial_threshold(
+            [utility_lists[item].get_total_utility() for item in items[:n_first_level]], top_k))
+    extensions = [(item, utility_lists[item], 1.0) for item in items]
+
+    workers = resolve_workers(workers)
+    if workers > 1 and n_first_level > 1:
+        cohuis = _mine_parallel(extensions, supports, minutil_abs, mincor, maxlen, twu_table, budget,
+                                top_k, workers, n_first_level)
+    else:
+        cohuis = TopKCollector(top_k, minutil_abs) if top_k is not None else []
+        for i in range(n_first_level):
+            _expand_extension([], None, extensions, i, supports, minutil_abs, mincor, maxlen,
+                              cohuis, twu_table, budget)
+
+    if budget is not None and budget.exhausted:
+        print(f"Warning: hết ngân sách tìm kiếm {budget.report()}, kết quả chưa đầy đủ", file=sys.stderr)
+    return cohuis.results() if top_k is not None else cohuis
@@ -0,0 +1,115 @@
+"""
+Khai thác CoHUI trên cửa sổ thời gian trượt của luồng đơn hàng:
+- window_days: chỉ giữ các đơn hàng trong N ngày gần nhất
+- half_life_days: trọng số suy giảm mũ 2^(-(now - t) / half_life) cho mỗi
+  đơn hàng, áp dụng cho cả utility lẫn support
+Suy giảm dùng mốc cố định (forward decay): đơn hàng t nhận trọng số
+2^((t - reference) / half_life) không đổi theo thời gian, trọng số thật chỉ
+khác một hệ số chung 2^(-(now - reference) / half_life). Ngưỡng minutil x
+tổng utility và Kulc không đổi khi nhân mọi trọng số với cùng một hệ số, nên
+tập CoHUI không phụ thuộc mốc; chỉ utility trả về được nhân lại hệ số đó.
+Nhờ vậy khi thời gian trôi, IncrementalCoIUM chỉ nhận đơn hàng mới và loại
+(evict) đơn hàng hết hạn, không phải xây lại cấu trúc nào.
+"""
+
+import itertools
+from collections import deque
+from algorithms.coium import IncrementalCoIUM
+from data_utils import WeightedDataset
+from order_ingest import parse_timestamp
+
+DAY_SECONDS = 86400
+
+# Số chu kỳ bán rã tối đa giữa mốc và đơn hàng mới nhất trước khi phải dựng lại (tránh tràn số thực)
+MAX_DECAY_EXPONENT = 64
+
+
+def window_rows(timestamps, transactions, window_days=None, now=None):
+    """
+    Các cặp (timestamp, transaction) trong cửa sổ, tăng dần theo thời gian
+    (giữ thứ tự gốc khi cùng thời điểm), cùng thời điểm `now` đã dùng
+    (mặc định: thời điểm của đơn hàng mới nhất). timestamps là giá trị gốc
+    (chuỗi ISO 8601 / mili giây, xem parse_timestamp), timestamp trả về là giây.
+    """
+    if any(timestamp is None for timestamp in timestamps):
+        raise ValueError("Chế độ cửa sổ thời gian cần orderDate cho mọi đơn hàng")
+    rows = sorted(zip(map(parse_timestamp, timestamps), transactions), key=lambda row: row[0])
+    if now is None:
+        now = rows[-1][0] if rows else 0
+    cutoff = now - window_days * DAY_SECONDS if window_days else None
+    rows = [row for row in rows if row[0] <= now and (cutoff is None or row[0] >= cutoff)]
+    return rows, now
+
+
+def decayed_dataset(rows, half_life_days=None, now=None):
+    """WeightedDataset của rows với trọng số suy giảm tại thời điểm now (không suy giảm: trọng số 1)"""
+    transactions = [transaction for _, transaction in rows]
+    if not half_life_days:
+        return WeightedDataset(transactions)
+    half_life = half_life_days * DAY_SECONDS
+    return WeightedDataset(transactions, [2 ** (-(now - timestamp) / half_life) for timestamp, _ in rows])
+
+
+class SlidingWindowMiner:
+    """
+    IncrementalCoIUM trên cửa sổ thời gian. advance() nhận toàn bộ các đơn
+    hàng trong cửa sổ hiện tại (window_rows) và chỉ áp dụng phần khác với lần
+    trước: đơn hàng ra khỏi cửa sổ được evict, đơn hàng mới được thêm. Trả về
+    False nếu cửa sổ mới không phải là cửa sổ cũ trượt về phía trước (vd.
+    lịch sử bị sửa) hoặc mốc suy giảm đã quá xa; khi đó cần tạo miner mới.
+    """
+
+    def __init__(self, minutil, mincor, maxlen=5, profits=None, window_days=None, half_life_days=None,
+                 dataset_name="unknown", workers=None):
+        self.window_days = window_days
+        self.half_life = half_life_days * DAY_SECONDS if half_life_days else None
+        self.miner = IncrementalCoIUM(minutil, mincor, maxlen, dataset_name=dataset_name,
+                                      profits=dict(profits) if profits is not None else {}, workers=workers)
+        self.rows = deque()
+        self.reference = None
+
+    @property
+    def profits(self):
+        return self.miner.profits
+
+    def _dataset(self, rows):
+        transactions = [transaction for _, transaction in rows]
+        if self.half_life is None:
+            return transactions
+        return WeightedDataset(transactions, [2 ** ((timestamp - self.reference) / self.half_life)
+                                              for timestamp, _ in rows])
+
+    def advance(self, rows, now):
+        """Đưa miner tới cửa sổ rows (kết quả của window_rows tại thời điểm now)"""
+        if self.reference is None and rows:
+            self.reference = rows[0][0]
+        if (self.half_life is not None and rows
+                and (rows[-1][0] - self.reference) / self.half_life > MAX_DECAY_EXPONENT):
+            return False
+
+        cutoff = now - self.window_days * DAY_SECONDS if self.window_days else None
+        n_expired = 0
+        if cutoff is not None:
+            while n_expired < len(self.rows) and self.rows[n_expired][0] < cutoff:
+                n_expired += 1
+        n_kept = len(self.rows) - n_expired
+        if len(rows) < n_kept or any(old is not new and old != new for old, new in
+                                     zip(itertools.islice(self.rows, n_expired, None), rows)):
+            return False
+
+        expired = [self.rows.popleft() for _ in range(n_expired)]
+        if expired:
+            self.miner.evict(self._dataset(expired))
+        added = rows[n_kept:]
+        if added:
+            self.miner.add_transactions(self._dataset(added))
+            self.rows.extend(added)
+        return True
+
+    def mine(self, now):
+        """CoHUI của cửa sổ hiện tại, utility tính theo trọng số tại thời điểm now"""
+        cohuis = self.miner.mine()
+        if self.half_life is None or self.reference is None:
+            return cohuis
+        scale = 2 ** (-(now - self.reference) / self.half_life)
+        return [(itemset, utility * scale, correlation) for itemset, utility, correlation in cohuis]
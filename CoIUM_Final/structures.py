@@ -1,60 +1,373 @@
+from array import array
+from bisect import bisect_left
+import numpy as np
+from data_utils import transaction_weights
+
+# Dưới ngưỡng này join bằng vòng merge thuần Python (tránh overhead của NumPy)
+JOIN_SMALL_SIZE = 64
+
+
+def _new_column(values=()):
+    """Tạo cột utility kiểu số nguyên 64-bit, tự chuyển sang số thực nếu cần"""
+    try:
+        return array('q', values)
+    except TypeError:
+        return array('d', values)
+
+
+def _append_value(column, value):
+    """Thêm giá trị vào cột; nâng cột 'q' lên 'd' khi gặp số thực"""
+    try:
+        column.append(value)
+    except TypeError:
+        column = array('d', column)
+        column.append(value)
+    return column
+
+
 class UtilityList:
-    """Cấu trúc Utility-List tối ưu"""
+    """Cấu trúc Utility-List tối ưu (lưu theo cột bằng typed array)"""
+    __slots__ = ('item', 'tids', 'iutils', 'rutils', '_total_utility', '_total_remaining')
+
     def __init__(self, item):
         self.item = item
-        self.elements = []  # (tid, iutil, rutil)
-        self._total_utility = None
-        self._total_remaining = None
+        self.tids = array('q')
+        self.iutils = _new_column()
+        self.rutils = _new_column()
+        self._total_utility = 0
+        self._total_remaining = 0
+
+    @classmethod
+    def from_columns(cls, item, tids, iutils, rutils):
+        """Tạo Utility-List trực tiếp từ 3 cột (tid tăng dần)"""
+        ul = cls(item)
+        ul.tids = tids if isinstance(tids, array) else array('q', tids)
+        ul.iutils = iutils if isinstance(iutils, array) else _new_column(iutils)
+        ul.rutils = rutils if isinstance(rutils, array) else _new_column(rutils)
+        ul._total_utility = sum(ul.iutils)
+        ul._total_remaining = sum(ul.rutils)
+        return ul
+
+    def __len__(self):
+        return len(self.tids)
 
     def add_element(self, tid, iutil, rutil):
-        self.elements.append((tid, iutil, rutil))
-        self._total_utility = None
-        self._total_remaining = None
+        self.tids.append(tid)
+        self.iutils = _append_value(self.iutils, iutil)
+        self.rutils = _append_value(self.rutils, rutil)
+        self._total_utility += iutil
+        self._total_remaining += rutil
+
+    @property
+    def elements(self):
+        """Danh sách (tid, iutil, rutil) – chỉ dùng cho tương thích, tốn bộ nhớ"""
+        return list(zip(self.tids, self.iutils, self.rutils))
 
     def get_total_utility(self):
-        if self._total_utility is None:
-            self._total_utility = sum(iutil for _, iutil, _ in self.elements)
         return self._total_utility
 
     def get_total_remaining_utility(self):
-        if self._total_remaining is None:
-            self._total_remaining = sum(rutil for _, _, rutil in self.elements)
         return self._total_remaining
 
     def get_transaction_ids(self):
-        return [tid for tid, _, _ in self.elements]
+        return self.tids.tolist()
+
+    def tid_view(self):
+        """View chỉ đọc (zero-copy) trên cột tid, tid tăng dần"""
+        return memoryview(self.tids).toreadonly()
 
 
 def construct_utility_list(item, dataset, profits):
     """Xây dựng Utility-List cho một item"""
     ul = UtilityList(item)
+    weights = transaction_weights(dataset)
     for tid, trans in enumerate(dataset):
         if item in trans:
-            iutil = profits[item]
+            weight = weights[tid] if weights is not None else 1
+            iutil = profits[item] * weight
             item_index = trans.index(item)
-            rutil = sum(profits[i] for i in trans[item_index + 1:])
+            rutil = sum(profits[i] for i in trans[item_index + 1:]) * weight
             ul.add_element(tid, iutil, rutil)
     return ul
 
 
-def construct_utility_list_combined(ul_x, ul_y, dataset, profits):
-    """Xây dựng UL cho itemset XY từ UL(X) và UL(Y)"""
-    tid_x = set(ul_x.get_transaction_ids())
-    tid_y = set(ul_y.get_transaction_ids())
-    common_tids = tid_x.intersection(tid_y)
-    if not common_tids:
+def _utility_typecode(profits):
+    """'q' nếu mọi profit là số nguyên, ngược lại 'd'"""
+    return 'q' if all(isinstance(p, (int, np.integer)) for p in profits.values()) else 'd'
+
+
+class UtilityListBuilder:
+    """
+    Xây Utility-List cho toàn bộ items tăng dần theo từng lô transaction;
+    tid được đánh liên tục qua các lô. Dữ liệu tích lũy trực tiếp trong các
+    cột typed array nên bộ nhớ chỉ phụ thuộc kích thước Utility-List cuối cùng.
+    - revised=False (CoIUM): `items` là thứ tự xử lý; rutil là tổng profit
+      của các item đứng sau item đó theo thứ tự này (suffix sum).
+    - revised=True (CoUPM): rutil = tổng utility của các item KHÁC trong transaction.
+    """
+
+    def __init__(self, items, profits, revised=False):
+        self.items = list(items)
+        self.profits = profits
+        self.revised = revised
+        self.n_transactions = 0
+        self.typecode = _utility_typecode(profits)
+        self._rank = {item: r for r, item in enumerate(self.items)}
+        self._columns = {item: (array('q'), array(self.typecode), array(self.typecode)) for item in self.items}
+
+    def add_transactions(self, transactions, weights=None):
+        """
+        weights[t]: số lần lặp (dataset đã nén) hoặc trọng số thực (vd. hệ số
+        suy giảm theo thời gian) của transaction t, nhân vào iutil và rutil
+        """
+        if (self.typecode == 'q' and weights is not None
+                and not all(isinstance(w, (int, np.integer)) for w in weights)):
+            self._promote()
+        if self.revised:
+            self._add_revised(transactions, weights)
+        else:
+            self._add_ordered(transactions, weights)
+
+    def _add_ordered(self, transactions, weights):
+        rank, columns, profits = self._rank, self._columns, self.profits
+        first_tid = self.n_transactions
+        for offset, trans in enumerate(transactions):
+            tid = first_tid + offset
+            weight = weights[offset] if weights is not None else 1
+            ordered = sorted(rank.keys() & set(trans), key=rank.__getitem__)
+            remaining = 0
+            for item in reversed(ordered):
+                iutil = profits[item] * weight
+                tids, iutils, rutils = columns[item]
+                tids.append(tid)
+                iutils.append(iutil)
+                rutils.append(remaining)
+                remaining += iutil
+        self.n_transactions = first_tid + len(transactions)
+
+    def _add_revised(self, transactions, weights):
+        wanted, columns, profits = self._rank.keys(), self._columns, self.profits
+        first_tid = self.n_transactions
+        for offset, trans in enumerate(transactions):
+            unique_items = set(trans)
+            present = wanted & unique_items
+            if not present:
+                continue
+            tid = first_tid + offset
+            weight = weights[offset] if weights is not None else 1
+            tu = sum(profits[i] for i in trans)
+            has_duplicates = len(unique_items) < len(trans)
+            for item in present:
+                iutil = profits[item]
+                copies = trans.count(item) if has_duplicates else 1
+                tids, iutils, rutils = columns[item]
+                tids.append(tid)
+                iutils.append(iutil * weight)
+                rutils.append((tu - iutil * copies) * weight)
+        self.n_transactions = first_tid + len(transactions)
+
+    def add_items(self, items):
+        """
+        Thêm item mới vào cuối thứ tự xử lý (vd. item lần đầu xuất hiện trong
+        lô transaction mới). Các transaction đã thêm không chứa item này nên
+        Utility-List hiện có không đổi.
+        """
+        new_items = [item for item in items if item not in self._rank]
+        if not new_items:
+            return
+        if _utility_typecode(self.profits) == 'd':
+            self._promote()
+        for item in new_items:
+            self._rank[item] = len(self.items)
+            self.items.append(item)
+            self._columns[item] = (array('q'), array(self.typecode), array(self.typecode))
+
+    def _promote(self):
+        """Chuyển mọi cột utility sang số thực ('d')"""
+        self.typecode = 'd'
+        for item, (tids, iutils, rutils) in self._columns.items():
+            if iutils.typecode == 'q':
+                self._columns[item] = (tids, array('d', iutils), array('d', rutils))
+
+    def drop_before(self, tid):
+        """
+        Bỏ mọi phần tử có tid < tid khỏi các Utility-List (các transaction cũ
+        nhất ra khỏi cửa sổ); tid của các transaction còn lại giữ nguyên.
+        """
+        for tids, iutils, rutils in self._columns.values():
+            k = bisect_left(tids, tid)
+            if k:
+                del tids[:k]
+                del iutils[:k]
+                del rutils[:k]
+
+    def item_count(self, item):
+        """Số transaction hiện có chứa item"""
+        return len(self._columns[item][0])
+
+    def build(self, items=None, copy=False):
+        """
+        Utility-List của `items` (mặc định: mọi item). copy=True sao chép các
+        cột để builder có thể tiếp tục nhận transaction mà không ảnh hưởng
+        tới các Utility-List đã trả về.
+        """
+        if items is None:
+            items = self.items
+        if copy:
+            return {item: UtilityList.from_columns(item, *(array(column.typecode, column)
+                                                           for column in self._columns[item]))
+                    for item in items}
+        return {item: UtilityList.from_columns(item, *self._columns[item]) for item in items}
+
+
+def build_utility_lists(items, dataset, profits):
+    """
+    Xây dựng Utility-List cho toàn bộ items trong một lượt duyệt dataset.
+    `items` là thứ tự xử lý; rutil của một item trong transaction là tổng
+    profit của các item đứng sau nó theo thứ tự này (suffix sum).
+    """
+    builder = UtilityListBuilder(items, profits)
+    builder.add_transactions(dataset, transaction_weights(dataset))
+    return builder.build()
+
+
+def build_revised_utility_lists(items, dataset, profits):
+    """
+    Xây dựng Revised Utility-List (CoUPM) cho toàn bộ items trong một lượt:
+    rutil = tổng utility của các item KHÁC trong transaction.
+    """
+    builder = UtilityListBuilder(items, profits, revised=True)
+    builder.add_transactions(dataset, transaction_weights(dataset))
+    return builder.build()
+
+
+def _column_view(column):
+    """View NumPy zero-copy trên một cột array('q') hoặc array('d')"""
+    return np.frombuffer(column, dtype=np.int64 if column.typecode == 'q' else np.float64)
+
+
+def _column_from_ndarray(values):
+    """Chuyển ndarray kết quả về cột array cùng kiểu"""
+    column = array('q' if values.dtype.kind in 'iub' else 'd')
+    column.frombytes(values.astype(np.int64 if column.typecode == 'q' else np.float64).tobytes())
+    return column
+
+
+def _combined_item(item_x, item_y):
+    return sorted(item_x + item_y if isinstance(item_x, list) else [item_x] + [item_y])
+
+
+def _merge_join(ul_x, ul_y, item, ul_prefix=None):
+    """Join hai cột tid tăng dần bằng merge tuyến tính (dùng cho list nhỏ)"""
+    tids_x, tids_y = ul_x.tids, ul_y.tids
+    iutils_x, iutils_y, rutils_y = ul_x.iutils, ul_y.iutils, ul_y.rutils
+    if ul_prefix is not None:
+        tids_p, iutils_p = ul_prefix.tids, ul_prefix.iutils
+    ul_xy = UtilityList(item)
+    i = j = k = 0
+    nx, ny = len(tids_x), len(tids_y)
+    while i < nx and j < ny:
+        tid_x, tid_y = tids_x[i], tids_y[j]
+        if tid_x == tid_y:
+            iutil = iutils_x[i] + iutils_y[j]
+            if ul_prefix is not None:
+                # tid của prefix là tập cha của tid X nên con trỏ k chỉ tiến về trước
+                while tids_p[k] < tid_x:
+                    k += 1
+                iutil -= iutils_p[k]
+            ul_xy.add_element(tid_x, iutil, rutils_y[j])
+            i += 1
+            j += 1
+        elif tid_x < tid_y:
+            i += 1
+        else:
+            j += 1
+    return ul_xy if len(ul_xy) else None
+
+
+def _prefix_adjusted_iutils(ul_x, ul_prefix):
+    """iutil(X) - iutil(P) tại từng tid của X, để không cộng utility của prefix hai lần"""
+    iutils_x = _column_view(ul_x.iutils)
+    if ul_prefix is None:
+        return iutils_x
+    pos_p = np.searchsorted(_column_view(ul_prefix.tids), _column_view(ul_x.tids))
+    return iutils_x - _column_view(ul_prefix.iutils)[pos_p]
+
+
+def _gather_join(base_iutils_x, ul_y, pos_x, pos_y, item):
+    """Tạo UL(XY) từ vị trí các tid chung trong UL(X) và UL(Y)"""
+    if not len(pos_y):
         return None
+    iutils = base_iutils_x[pos_x] + _column_view(ul_y.iutils)[pos_y]
+    return UtilityList.from_columns(
+        item,
+        _column_from_ndarray(_column_view(ul_y.tids)[pos_y]),
+        _column_from_ndarray(iutils),
+        _column_from_ndarray(_column_view(ul_y.rutils)[pos_y]),
+    )
+
+
+def _search_positions(tids_x, tids_y):
+    """Galloping bằng tìm kiếm nhị phân: vị trí mỗi tid của Y trong X (hoặc -1)"""
+    if not len(tids_x):
+        return np.full(len(tids_y), -1, dtype=np.int64)
+    pos = np.searchsorted(tids_x, tids_y)
+    np.minimum(pos, len(tids_x) - 1, out=pos)
+    return np.where(tids_x[pos] == tids_y, pos, -1)
+
 
-    itemset_xy = sorted(ul_x.item + ul_y.item if isinstance(ul_x.item, list) else [ul_x.item] + [ul_y.item])
-    ul_xy = UtilityList(itemset_xy)
+def join_utility_lists(ul_x, ul_y, ul_prefix=None):
+    """
+    Join UL(X) và UL(Y) thành UL(XY) bằng cách duyệt trực tiếp hai cột tid
+    đã sắp tăng dần: merge tuyến tính cho list nhỏ, galloping (tìm kiếm nhị
+    phân list ngắn trong list dài) cho list lớn. Trả về None nếu không có tid chung.
+    Nếu X = Px và Y = Py cùng prefix P, truyền ul_prefix = UL(P) để
+    iutil(PXY) = iutil(Px) + iutil(Py) - iutil(P).
+    """
+    item = _combined_item(ul_x.item, ul_y.item)
+    if len(ul_x) + len(ul_y) <= JOIN_SMALL_SIZE:
+        return _merge_join(ul_x, ul_y, item, ul_prefix)
 
-    x_dict = {tid: (iutil, rutil) for tid, iutil, rutil in ul_x.elements}
-    y_dict = {tid: (iutil, rutil) for tid, iutil, rutil in ul_y.elements}
+    tids_x, tids_y = _column_view(ul_x.tids), _column_view(ul_y.tids)
+    if len(tids_x) <= len(tids_y):
+        pos_y = _search_positions(tids_y, tids_x)
+        pos_x = np.flatnonzero(pos_y >= 0)
+        pos_y = pos_y[pos_x]
+    else:
+        pos_x = _search_positions(tids_x, tids_y)
+        pos_y = np.flatnonzero(pos_x >= 0)
+        pos_x = pos_x[pos_y]
+    return _gather_join(_prefix_adjusted_iutils(ul_x, ul_prefix), ul_y, pos_x, pos_y, item)
 
-    for tid in sorted(common_tids):
-        iutil_x, _ = x_dict[tid]
-        iutil_y, rutil_y = y_dict[tid]
-        iutil_xy = iutil_x + iutil_y
-        ul_xy.add_element(tid, iutil_xy, rutil_y)
 
-    return ul_xy
\ No newline at end of file
+def join_utility_lists_batch(ul_x, siblings, ul_prefix=None):
+    """
+    Join một UL(X) với toàn bộ các UL anh em trong một lượt: tid của mọi
+    sibling được ghép lại và tìm trong cột tid của X bằng một lần galloping.
+    Trả về list cùng thứ tự với siblings (None nếu không có tid chung).
+    """
+    if not siblings:
+        return []
+    if len(ul_x) + max(len(ul_y) for ul_y in siblings) <= JOIN_SMALL_SIZE:
+        return [join_utility_lists(ul_x, ul_y, ul_prefix) for ul_y in siblings]
+
+    tids_x = _column_view(ul_x.tids)
+    base_iutils_x = _prefix_adjusted_iutils(ul_x, ul_prefix)
+    all_tids = np.concatenate([_column_view(ul_y.tids) for ul_y in siblings])
+    all_pos = _search_positions(tids_x, all_tids)
+
+    results = []
+    start = 0
+    for ul_y in siblings:
+        end = start + len(ul_y)
+        pos_x = all_pos[start:end]
+        pos_y = np.flatnonzero(pos_x >= 0)
+        item = _combined_item(ul_x.item, ul_y.item)
+        results.append(_gather_join(base_iutils_x, ul_y, pos_x[pos_y], pos_y, item))
+        start = end
+    return results
+
+
+def construct_utility_list_combined(ul_x, ul_y, dataset, profits):
+    """Xây dựng UL cho itemset XY từ UL(X) và UL(Y)"""
+    return join_utility_lists(ul_x, ul_y)
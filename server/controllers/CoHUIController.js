@@ -1,5 +1,6 @@
 const { spawn } = require('child_process');
 const path = require('path');
+const os = require('os');
 const fs = require('fs');
 const Order = require('../models/Order');
 const OrderDetail = require('../models/OrderDetail');
@@ -7,6 +8,160 @@ const Product = require('../models/Product');
 const ProductSizeStock = require('../models/ProductSizeStock');
 const ProductColor = require('../models/ProductColor');
 
+// Pool worker Python chạy lâu dài (khởi động khi cần, tối đa PYTHON_WORKER_POOL_SIZE tiến trình).
+// Mỗi worker chạy một request tại một thời điểm; request chờ trong hàng đợi tới khi có worker rảnh,
+// nên một lần khai thác chậm chỉ chiếm một worker thay vì chặn mọi request khác
+const PYTHON_WORKER_POOL_SIZE = parseInt(process.env.PYTHON_WORKER_POOL_SIZE) || Math.max(1, os.cpus().length - 1);
+
+// Thời gian tối đa (ms) chờ response cho một request (kể cả thời gian chờ worker rảnh)
+const PYTHON_REQUEST_TIMEOUT_MS = parseInt(process.env.PYTHON_REQUEST_TIMEOUT_MS) || 120000;
+
+const pythonWorkers = [];
+const pythonQueue = [];
+let nextRequestId = 1;
+
+// Kết thúc request đúng một lần (dừng timer, giải phóng worker đang chạy nó)
+function settleRequest(request, error, result) {
+    if (request.done) {
+        return;
+    }
+    request.done = true;
+    clearTimeout(request.timer);
+    if (request.worker && request.worker.current === request) {
+        request.worker.current = null;
+    }
+    if (error) {
+        request.reject(error);
+    } else {
+        request.resolve(result);
+    }
+}
+
+function removeWorker(worker) {
+    const index = pythonWorkers.indexOf(worker);
+    if (index >= 0) {
+        pythonWorkers.splice(index, 1);
+    }
+}
+
+function spawnPythonWorker() {
+    const pythonScript = path.join(__dirname, '../../CoIUM_Final/recommendation_service.py');
+    const pythonProcess = spawn('python', [pythonScript, '--worker'], {
+        cwd: path.join(__dirname, '../../CoIUM_Final')
+    });
+    const worker = { process: pythonProcess, current: null };
+    let buffer = '';
+
+    // Giải mã UTF-8 theo stream: ký tự nhiều byte bị cắt giữa hai chunk không làm hỏng JSON
+    pythonProcess.stdout.setEncoding('utf8');
+    pythonProcess.stdout.on('data', (data) => {
+        buffer += data;
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (!line) {
+                continue;
+            }
+            const request = worker.current;
+            if (!request) {
+                console.error('Unexpected Python output:', line);
+                continue;
+            }
+            let result;
+            try {
+                result = JSON.parse(line);
+            } catch (error) {
+                console.error('Failed to parse Python output:', line);
+                settleRequest(request, new Error('Invalid response from Python service'));
+                continue;
+            }
+            if (result.id === undefined || result.id === null) {
+                // Response không có id (request hỏng tới mức không đọc được id): vẫn là của request đang chạy
+                settleRequest(request, new Error(result.message || 'Python service returned a response without id'));
+            } else if (result.id === request.id) {
+                delete result.id;
+                settleRequest(request, null, result);
+            } else {
+                console.error('Unexpected Python response id:', result.id);
+                continue;
+            }
+            dispatchPythonRequests();
+        }
+    });
+
+    pythonProcess.stderr.on('data', (data) => {
+        console.error('Python stderr:', data.toString());
+    });
+
+    let exited = false;
+    const onExit = (error) => {
+        if (exited) {
+            return;
+        }
+        exited = true;
+        removeWorker(worker);
+        if (worker.current) {
+            settleRequest(worker.current, error);
+        }
+        dispatchPythonRequests();
+    };
+
+    pythonProcess.on('close', (code) => {
+        onExit(new Error(`Python process exited with code ${code}`));
+    });
+
+    pythonProcess.on('error', (error) => {
+        onExit(new Error(`Failed to start Python process: ${error.message}`));
+    });
+
+    pythonProcess.stdin.on('error', (error) => {
+        onExit(new Error(`Python process stdin error: ${error.message}`));
+        pythonProcess.kill();
+    });
+
+    pythonWorkers.push(worker);
+    return worker;
+}
+
+// Giao các request đang chờ cho worker rảnh, khởi động thêm worker nếu pool chưa đầy
+function dispatchPythonRequests() {
+    while (pythonQueue.length > 0) {
+        let worker = pythonWorkers.find((w) => !w.current);
+        if (!worker) {
+            if (pythonWorkers.length >= PYTHON_WORKER_POOL_SIZE) {
+                return;
+            }
+            try {
+                worker = spawnPythonWorker();
+            } catch (error) {
+                settleRequest(pythonQueue.shift(), new Error(`Failed to start Python process: ${error.message}`));
+                continue;
+            }
+        }
+        const request = pythonQueue.shift();
+        worker.current = request;
+        request.worker = worker;
+        // id đứng đầu để worker vẫn trả lại được id khi phần còn lại của request hỏng
+        worker.process.stdin.write(JSON.stringify({ id: request.id, ...request.inputData }) + '\n');
+    }
+}
+
+function onPythonRequestTimeout(request) {
+    const queued = pythonQueue.indexOf(request);
+    if (queued >= 0) {
+        pythonQueue.splice(queued, 1);
+    }
+    const worker = request.worker;
+    settleRequest(request, new Error(`Python service timed out after ${PYTHON_REQUEST_TIMEOUT_MS} ms`));
+    if (queued < 0 && worker) {
+        // Worker còn kẹt ở request này: chỉ dừng tiến trình đó, các worker khác không bị ảnh hưởng
+        removeWorker(worker);
+        worker.process.kill();
+        dispatchPythonRequests();
+    }
+}
+
 /**
  * Controller cho CoHUI Recommendation System
  * Tích hợp thuật toán CoHUI Python vào Node.js
@@ -80,13 +235,16 @@ class CoHUIController {
                     { orderStatus: 'completed' },
                     { shippingStatus: 'delivered' }
                 ]
-            }).sort({ createdAt: -1 }).select('orderID');
+            }).sort({ createdAt: -1 }).select('orderID createdAt');
             
             if (limit > 0) {
                 ordersQuery = ordersQuery.limit(limit);
             }
             
-            const orders = await ordersQuery.lean();
+            // Lấy N đơn mới nhất nhưng gửi theo thứ tự cũ trước mới sau: giữa hai request, đơn
+            // mới nối vào cuối và đơn cũ nhất rơi khỏi đầu danh sách, nên worker Python khai thác
+            // tăng dần (chỉ thêm đơn mới / loại đơn cũ) thay vì khai thác lại toàn bộ
+            const orders = (await ordersQuery.lean()).reverse();
             
             const orderIDs = orders.map(o => o.orderID);
             const allOrderDetails = await OrderDetail.find({ 
@@ -131,6 +289,7 @@ class CoHUIController {
                     if (items.length > 0) {
                         ordersData.push({
                             orderID: order.orderID,
+                            orderDate: order.createdAt,
                             items: items
                         });
                     }
@@ -148,52 +307,19 @@ class CoHUIController {
     }
 
     /**
-     * Gọi Python script để chạy thuật toán CoHUI
-     * Sử dụng stdin để truyền data lớn (tránh ENAMETOOLONG)
+     * Gọi Python service để chạy thuật toán CoHUI
+     * Dùng pool worker Python chạy lâu dài (recommendation_service.py --worker):
+     * mỗi request là một dòng JSON trên stdin, response là một dòng JSON trên stdout,
+     * ghép cặp theo id. Tránh chi phí khởi động interpreter + import NumPy mỗi request.
+     * Mỗi request chạy trên một worker riêng; request quá PYTHON_REQUEST_TIMEOUT_MS bị
+     * reject và chỉ worker đang chạy nó bị dừng.
      */
     static async callPythonService(inputData) {
         return new Promise((resolve, reject) => {
-            // Đường dẫn đến Python script
-            const pythonScript = path.join(__dirname, '../../CoIUM_Final/recommendation_service.py');
-            
-            // Gọi Python KHÔNG truyền data qua argument
-            const pythonProcess = spawn('python', [pythonScript], {
-                cwd: path.join(__dirname, '../../CoIUM_Final')
-            });
-
-            let dataString = '';
-            let errorString = '';
-
-            pythonProcess.stdout.on('data', (data) => {
-                dataString += data.toString();
-            });
-
-            pythonProcess.stderr.on('data', (data) => {
-                errorString += data.toString();
-            });
-
-            pythonProcess.on('close', (code) => {
-                if (code !== 0) {
-                    console.error('Python stderr:', errorString);
-                    reject(new Error(`Python process exited with code ${code}: ${errorString}`));
-                } else {
-                    try {
-                        const result = JSON.parse(dataString);
-                        resolve(result);
-                    } catch (error) {
-                        console.error('Failed to parse Python output:', dataString);
-                        reject(new Error('Invalid JSON from Python service'));
-                    }
-                }
-            });
-
-            pythonProcess.on('error', (error) => {
-                reject(new Error(`Failed to start Python process: ${error.message}`));
-            });
-            
-            // Ghi data vào stdin thay vì argument
-            pythonProcess.stdin.write(JSON.stringify(inputData));
-            pythonProcess.stdin.end();
+            const request = { id: nextRequestId++, inputData, resolve, reject, worker: null, done: false };
+            request.timer = setTimeout(() => onPythonRequestTimeout(request), PYTHON_REQUEST_TIMEOUT_MS);
+            pythonQueue.push(request);
+            dispatchPythonRequests();
         });
     }
 
@@ -318,7 +444,9 @@ class CoHUIController {
                 mincor = 0.3, 
                 maxlen = 3, 
                 topN = 10,
-                limit = 5000
+                limit = 5000,
+                windowDays,
+                decayHalfLifeDays
             } = req.query;
 
             // Lấy dữ liệu đơn hàng với limit
@@ -341,6 +469,9 @@ class CoHUIController {
                 maxlen: parseInt(maxlen),
                 topN: parseInt(topN)
             };
+            // Cửa sổ thời gian (tùy chọn): chỉ dùng đơn hàng N ngày gần nhất / suy giảm theo tuổi đơn hàng
+            if (windowDays) inputData.windowDays = parseFloat(windowDays);
+            if (decayHalfLifeDays) inputData.decayHalfLifeDays = parseFloat(decayHalfLifeDays);
 
             const result = await CoHUIController.callPythonService(inputData);
             